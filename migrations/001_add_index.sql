@@ -0,0 +1,36 @@
+-- Covering index for the dashboard production queries.
+--
+-- TEMPLATE: dbo.ProductRecordLog below is an assumed name for the table
+-- behind ProductRecordLogView; nothing in this repository references it.
+-- Check the view definition and replace the table name before running.
+-- The script stops with an error if the table does not exist.
+--
+-- Every query in src/backend/database.py filters ProductRecordLogView on
+-- UnitName (= ?, or joined to a list of requested names) AND KayitTarihi
+-- BETWEEN ? AND ? and reads only Model, ModelSuresiSN and TestSonucu.
+-- Without an index keyed on (UnitName, KayitTarihi) each call scans the
+-- clustered index.
+--
+-- Index hints cannot be placed on a non-indexed view, so the index goes on
+-- the base table behind ProductRecordLogView and the optimizer picks it up
+-- when the view is expanded. If the view sources these columns from a
+-- different table, point the statement at that table instead.
+
+IF OBJECT_ID('dbo.ProductRecordLog', 'U') IS NULL
+BEGIN
+    RAISERROR('Table dbo.ProductRecordLog not found: edit 001_add_index.sql to name the base table behind ProductRecordLogView.', 16, 1);
+    RETURN;
+END
+
+IF NOT EXISTS (
+    SELECT 1
+    FROM sys.indexes
+    WHERE name = 'IX_ProductRecordLog_Unit_Tarihi'
+      AND object_id = OBJECT_ID('dbo.ProductRecordLog')
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_ProductRecordLog_Unit_Tarihi
+        ON dbo.ProductRecordLog (UnitName, KayitTarihi)
+        INCLUDE (Model, ModelSuresiSN, TestSonucu);
+END
+GO
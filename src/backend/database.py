@@ -1,13 +1,22 @@
+import logging
 import os
 import aioodbc
+import pyodbc
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-import pytz
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from time import monotonic
+from zoneinfo import ZoneInfo
 
 load_dotenv()
 
-# Define timezone constant for application (GMT+3)
-TIMEZONE = pytz.timezone('Europe/Istanbul')  # Turkey is in GMT+3
+logger = logging.getLogger("dashboard.db")
+
+# Define timezone constant for application (GMT+3).
+# Turkey has had no DST since 2016, so attaching the zone with
+# replace(tzinfo=TIMEZONE) is unambiguous -- no pytz-style localize needed.
+TIMEZONE = ZoneInfo('Europe/Istanbul')
 
 # Define shift breaks
 SHIFT_BREAKS = {
@@ -29,51 +38,92 @@ WORKING_MODE_BREAKS = {
     'mode3': ['a', 'b', 'c', 'd', 'f', 'g', 'h', 'i']
 }
 
-def calculate_break_time(start_time, end_time, working_mode='mode1'):
-    """
-    Calculate total break time that occurred between start_time and end_time
-    based on the working mode. Pure computation -- no I/O.
-    """
-    if working_mode not in WORKING_MODE_BREAKS:
-        working_mode = 'mode1'
+SECONDS_PER_DAY = 86400
+
 
-    applicable_breaks = WORKING_MODE_BREAKS[working_mode]
-    total_break_seconds = 0
+def _seconds_of_day(hhmm):
+    t = time.fromisoformat(hhmm)
+    return t.hour * 3600 + t.minute * 60
 
-    if start_time.tzinfo != TIMEZONE:
-        start_time = start_time.astimezone(TIMEZONE)
-    if end_time.tzinfo != TIMEZONE:
-        end_time = end_time.astimezone(TIMEZONE)
 
-    for break_id in applicable_breaks:
-        break_info = SHIFT_BREAKS[break_id]
+def _break_window(break_id):
+    """(start, end) of a break as seconds after local midnight; end may pass 24h."""
+    start = _seconds_of_day(SHIFT_BREAKS[break_id]['start'])
+    end = _seconds_of_day(SHIFT_BREAKS[break_id]['end'])
+    if start > end:
+        end += SECONDS_PER_DAY
+    return start, end
 
-        break_start_time = datetime.strptime(break_info['start'], '%H:%M').time()
-        break_end_time = datetime.strptime(break_info['end'], '%H:%M').time()
 
-        current_date = start_time.date()
-        end_date = end_time.date()
+# Break windows per working mode, built once at import
+_BREAKS_BY_MODE = {
+    mode: tuple(_break_window(b) for b in break_ids)
+    for mode, break_ids in WORKING_MODE_BREAKS.items()
+}
 
-        while current_date <= end_date:
-            break_start_dt = datetime.combine(current_date, break_start_time)
-            break_end_dt = datetime.combine(current_date, break_end_time)
 
-            if break_start_time > break_end_time:
-                break_end_dt = break_end_dt + timedelta(days=1)
+# TIMEZONE's fixed UTC offset in seconds (no DST -- see TIMEZONE above)
+_UTC_OFFSET = TIMEZONE.utcoffset(datetime.now()).total_seconds()
 
-            break_start_dt = TIMEZONE.localize(break_start_dt)
-            break_end_dt = TIMEZONE.localize(break_end_dt)
 
-            overlap_start = max(start_time, break_start_dt)
-            overlap_end = min(end_time, break_end_dt)
+def _day_break_overlap(day_start, start_ts, end_ts, breaks):
+    """Seconds of one day's breaks (day_start = local midnight) inside [start_ts, end_ts]."""
+    total = 0
+    for break_start, break_end in breaks:
+        overlap = min(end_ts, day_start + break_end) - max(start_ts, day_start + break_start)
+        if overlap > 0:
+            total += overlap
+    return total
 
-            if overlap_start < overlap_end:
-                overlap_seconds = (overlap_end - overlap_start).total_seconds()
-                total_break_seconds += overlap_seconds
 
-            current_date += timedelta(days=1)
+@lru_cache(maxsize=4096)
+def _break_seconds(start_ts, end_ts, breaks):
+    """
+    Seconds of `breaks` falling inside [start_ts, end_ts] (epoch seconds).
+
+    Range intersection in O(breaks): every break of an interior day lies
+    wholly inside the range and contributes the mode's full daily total, so
+    only the first day and the last two days (a break may run past midnight
+    into the final day) are intersected break by break.
+
+    Memoized: hour-aligned slices and the fixed start of a dashboard window
+    recur on every push and across clients, so most calls are cache hits.
+    """
+    # Local midnight of the start day; each day's breaks are fixed offsets from it
+    first_day = start_ts - (start_ts + _UTC_OFFSET) % SECONDS_PER_DAY
+    if end_ts < first_day:
+        return 0
+    n_days = int((end_ts - first_day) // SECONDS_PER_DAY) + 1
+
+    if n_days <= 3:
+        return sum(
+            _day_break_overlap(first_day + d * SECONDS_PER_DAY, start_ts, end_ts, breaks)
+            for d in range(n_days)
+        )
+
+    daily_total = sum(break_end - break_start for break_start, break_end in breaks)
+    last_day = first_day + (n_days - 1) * SECONDS_PER_DAY
+    return (
+        _day_break_overlap(first_day, start_ts, end_ts, breaks)
+        + (n_days - 3) * daily_total
+        + _day_break_overlap(last_day - SECONDS_PER_DAY, start_ts, end_ts, breaks)
+        + _day_break_overlap(last_day, start_ts, end_ts, breaks)
+    )
+
+
+def calculate_break_time(start_time, end_time, working_mode='mode1'):
+    """
+    Calculate total break time that occurred between start_time and end_time
+    based on the working mode. Pure computation -- no I/O.
+    """
+    breaks = _BREAKS_BY_MODE.get(working_mode, _BREAKS_BY_MODE['mode1'])
+    return _break_seconds(start_time.timestamp(), end_time.timestamp(), breaks)
+
 
-    return total_break_seconds
+def calculate_break_times(intervals, working_mode='mode1'):
+    """Break time for each (start_time, end_time) in intervals, in order."""
+    breaks = _BREAKS_BY_MODE.get(working_mode, _BREAKS_BY_MODE['mode1'])
+    return [_break_seconds(start.timestamp(), end.timestamp(), breaks) for start, end in intervals]
 
 
 # ---------------------------------------------------------------------------
@@ -82,6 +132,12 @@ def calculate_break_time(start_time, end_time, working_mode='mode1'):
 
 _pool = None
 
+# Report and hourly endpoints fan out one query per unit/hour concurrently,
+# so the pool needs enough connections to actually overlap those round trips.
+POOL_MINSIZE = 2
+POOL_MAXSIZE = int(os.getenv("DB_POOL_MAXSIZE", "20"))
+
+
 def _build_dsn():
     return (
         f'DRIVER={{ODBC Driver 18 for SQL Server}};'
@@ -95,14 +151,28 @@ def _build_dsn():
     )
 
 
+# Fixed ODBC parameter types for the production queries. pyodbc otherwise
+# sizes the NVARCHAR parameter to each unit name's length, so SQL Server sees
+# a different parameterized statement (and compiles a separate plan) per unit.
+_UNIT_PARAM = (pyodbc.SQL_WVARCHAR, 128, 0)
+_TS_PARAM = (pyodbc.SQL_TYPE_TIMESTAMP, 27, 7)
+
+
+async def _pin_param_types(cursor, n_units=1):
+    """Bind n_units unit-name parameters followed by a start/end timestamp pair."""
+    await cursor.setinputsizes([_UNIT_PARAM] * n_units + [_TS_PARAM, _TS_PARAM])
+
+
 async def init_pool():
     """Create the async connection pool. Call once at app startup."""
     global _pool
     dsn = _build_dsn()
-    print(f"[DB] Initializing async connection pool...")
-    print(f"[DB] Server: {os.getenv('DB_SERVER')}, Database: {os.getenv('DB_NAME')}")
-    _pool = await aioodbc.create_pool(dsn=dsn, minsize=2, maxsize=10)
-    print(f"[DB] Connection pool ready (min=2, max=10)")
+    logger.info("[DB] Initializing async connection pool...")
+    logger.info("[DB] Server: %s, Database: %s", os.getenv('DB_SERVER'), os.getenv('DB_NAME'))
+    # Read-only workload: autocommit skips the implicit transaction pyodbc
+    # otherwise opens (and must commit or roll back) around every SELECT.
+    _pool = await aioodbc.create_pool(dsn=dsn, minsize=POOL_MINSIZE, maxsize=POOL_MAXSIZE, autocommit=True)
+    logger.info("[DB] Connection pool ready (min=%d, max=%d)", POOL_MINSIZE, POOL_MAXSIZE)
 
 
 async def close_pool():
@@ -112,37 +182,308 @@ async def close_pool():
         _pool.close()
         await _pool.wait_closed()
         _pool = None
-        print("[DB] Connection pool closed")
+        logger.info("[DB] Connection pool closed")
+
+
+# ---------------------------------------------------------------------------
+# Query texts
+# ---------------------------------------------------------------------------
+
+# Built once at import so every call sends byte-identical statement text;
+# together with the pinned parameter types this lets SQL Server reuse one
+# cached plan per query instead of compiling a new one per call. The multi-unit
+# variants are templates because their text depends on the unit count.
+
+_UNITS_QUERY = "SELECT DISTINCT UnitName FROM ProductRecordLogView ORDER BY UnitName"
+
+# Per-model query with a grand-total row: the empty grouping set adds one
+# row with IsTotal = 1 so callers don't have to re-sum the per-model rows.
+_MODEL_QUERY_TEMPLATE = """
+    SELECT
+        Model,
+        SUM(CASE WHEN TestSonucu = 1 THEN 1 ELSE 0 END) as SuccessQty,
+        SUM(CASE WHEN TestSonucu = 0 THEN 1 ELSE 0 END) as FailQty,
+        ModelSuresiSN as Target,
+        GROUPING(Model) as IsTotal
+    FROM
+        ProductRecordLogView
+    WHERE
+        UnitName = ?
+        AND {range_clause}
+    GROUP BY
+        GROUPING SETS ((Model, ModelSuresiSN), ())
+    """
+_MODEL_QUERY = _MODEL_QUERY_TEMPLATE.format(range_clause="KayitTarihi BETWEEN ? AND ?")
+_MODEL_DELTA_QUERY = _MODEL_QUERY_TEMPLATE.format(range_clause="KayitTarihi > ? AND KayitTarihi <= ?")
+
+_HOURLY_QUERY_TEMPLATE = """
+    SELECT
+        Model,
+        DATEADD(hour, DATEDIFF(hour, 0, KayitTarihi), 0) as HourBucket,
+        SUM(CASE WHEN TestSonucu = 1 THEN 1 ELSE 0 END) as SuccessQty,
+        SUM(CASE WHEN TestSonucu = 0 THEN 1 ELSE 0 END) as FailQty,
+        ModelSuresiSN as Target
+    FROM
+        ProductRecordLogView
+    WHERE
+        UnitName = ?
+        AND {range_clause}
+    GROUP BY
+        Model, ModelSuresiSN, DATEADD(hour, DATEDIFF(hour, 0, KayitTarihi), 0)
+    """
+_HOURLY_QUERY = _HOURLY_QUERY_TEMPLATE.format(range_clause="KayitTarihi BETWEEN ? AND ?")
+_HOURLY_DELTA_QUERY = _HOURLY_QUERY_TEMPLATE.format(range_clause="KayitTarihi > ? AND KayitTarihi <= ?")
+
+# The requested names come in as a VALUES list joined on UnitName, and rows
+# are grouped by the requested name rather than the stored one: the server's
+# collation decides which rows match, and each row comes back labelled with
+# exactly the string the caller asked for.
+_MULTI_SUMMARY_QUERY_TEMPLATE = """
+    SELECT
+        req.UnitName,
+        SUM(CASE WHEN v.TestSonucu = 1 THEN 1 ELSE 0 END) as SuccessQty,
+        SUM(CASE WHEN v.TestSonucu = 0 THEN 1 ELSE 0 END) as FailQty
+    FROM
+        (VALUES {placeholders}) AS req(UnitName)
+        JOIN ProductRecordLogView v ON v.UnitName = req.UnitName
+    WHERE
+        v.KayitTarihi BETWEEN ? AND ?
+    GROUP BY
+        req.UnitName
+    """
+
+# (req.UnitName) adds one total row per unit, flagged by GROUPING(v.Model)
+_MULTI_MODEL_QUERY_TEMPLATE = """
+    SELECT
+        req.UnitName,
+        v.Model,
+        SUM(CASE WHEN v.TestSonucu = 1 THEN 1 ELSE 0 END) as SuccessQty,
+        SUM(CASE WHEN v.TestSonucu = 0 THEN 1 ELSE 0 END) as FailQty,
+        v.ModelSuresiSN as Target,
+        GROUPING(v.Model) as IsTotal
+    FROM
+        (VALUES {placeholders}) AS req(UnitName)
+        JOIN ProductRecordLogView v ON v.UnitName = req.UnitName
+    WHERE
+        v.KayitTarihi BETWEEN ? AND ?
+    GROUP BY
+        GROUPING SETS ((req.UnitName, v.Model, v.ModelSuresiSN), (req.UnitName))
+    """
 
 
 async def get_production_units():
     async with _pool.acquire() as conn:
         async with conn.cursor() as cursor:
-            await cursor.execute(
-                "SELECT DISTINCT UnitName FROM ProductRecordLogView ORDER BY UnitName"
-            )
+            await cursor.execute(_UNITS_QUERY)
             rows = await cursor.fetchall()
             return [row[0] for row in rows]
 
 
-async def get_production_data(unit_name, start_time, end_time, current_time=None, is_live=False, working_mode='mode1'):
-    # Ensure current_time is localized
-    if current_time and current_time.tzinfo is None:
-        current_time = TIMEZONE.localize(current_time)
-    elif current_time and current_time.tzinfo != TIMEZONE:
-        current_time = current_time.astimezone(TIMEZONE)
+# ---------------------------------------------------------------------------
+# Query execution + cache for settled (past) windows
+# ---------------------------------------------------------------------------
+
+# A window that ended this long ago is treated as immutable -- the same
+# 5-minute cutoff the endpoints use to tell live from historical data.
+SETTLED_AFTER = timedelta(minutes=5)
+SETTLED_CACHE_MAXSIZE = 1024
+FETCH_BATCH_SIZE = 1000
+
+_settled_rows = OrderedDict()
 
-    # Ensure start_time is localized
-    if start_time.tzinfo is None:
-        start_time = TIMEZONE.localize(start_time)
-    elif start_time.tzinfo != TIMEZONE:
-        start_time = start_time.astimezone(TIMEZONE)
 
-    # Ensure end_time is localized
-    if end_time.tzinfo is None:
-        end_time = TIMEZONE.localize(end_time)
-    elif end_time.tzinfo != TIMEZONE:
-        end_time = end_time.astimezone(TIMEZONE)
+async def _fetch_rows(query, params, n_units=1):
+    """
+    Run a production query and return its rows as plain tuples.
+
+    Rows are pulled FETCH_BATCH_SIZE at a time and converted as they arrive,
+    so the driver never holds the whole result set as pyodbc Row objects.
+    """
+    rows = []
+    async with _pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            cursor.arraysize = FETCH_BATCH_SIZE
+            await _pin_param_types(cursor, n_units)
+            await cursor.execute(query, params)
+            while True:
+                batch = await cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not batch:
+                    break
+                rows.extend(tuple(row) for row in batch)
+    return rows
+
+
+async def _fetch_rows_cached(query, params, n_units=1):
+    """
+    _fetch_rows, memoized by (query, params) once the window is settled.
+
+    params must end with the window's query end time. Past windows are a
+    pure function of their key, so entries are never invalidated -- only
+    evicted least-recently-used beyond SETTLED_CACHE_MAXSIZE.
+    """
+    if params[-1] > datetime.now(TIMEZONE) - SETTLED_AFTER:
+        return await _fetch_rows(query, params, n_units)
+
+    key = (query, params)
+    rows = _settled_rows.get(key)
+    if rows is not None:
+        _settled_rows.move_to_end(key)
+        return rows
+
+    rows = await _fetch_rows(query, params, n_units)
+    _settled_rows[key] = rows
+    if len(_settled_rows) > SETTLED_CACHE_MAXSIZE:
+        _settled_rows.popitem(last=False)
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Live tail: incremental counts for live windows
+# ---------------------------------------------------------------------------
+
+# Live dashboards re-query the same window every few seconds. Counts for
+# (query, unit, window start) are kept and advanced with a delta query covering only
+# rows newer than the previous end. A full re-scan happens when an entry has
+# not been advanced for LIVE_TAIL_MAX_AGE seconds, and at least every
+# LIVE_TAIL_REBASE seconds so rows committed late (behind the 2s live buffer)
+# are picked up.
+LIVE_TAIL_MAX_AGE = 60
+LIVE_TAIL_REBASE = 300
+LIVE_TAIL_MAXSIZE = 256
+
+_live_tail = OrderedDict()
+
+
+def _split_model_rows(rows):
+    """Split grouped rows into ({(model, target): (success, fail)}, (total_success, total_fail))."""
+    counts = {}
+    totals = (0, 0)
+    for model, success, fail, target, is_total in rows:
+        if is_total:
+            totals = (success or 0, fail or 0)
+        else:
+            counts[(model, target)] = (success, fail)
+    return counts, totals
+
+
+def _split_hourly_rows(rows):
+    """Hour-bucketed rows as ({(hour_bucket, model, target): (success, fail)}, (0, 0))."""
+    counts = {}
+    for model, hour_bucket, success, fail, target in rows:
+        counts[(hour_bucket, model, target)] = (success, fail)
+    return counts, (0, 0)
+
+
+async def _fetch_live_counts(query, delta_query, split_rows, unit_name, start_time, end_time):
+    """
+    Counts and totals for a live window, advanced incrementally.
+
+    query/delta_query are the full-window and (previous end, end] variants of
+    the same statement; split_rows turns their rows into additive counts.
+    """
+    key = (query, unit_name, start_time)
+    entry = _live_tail.get(key)
+    now = monotonic()
+
+    if (
+        entry is not None
+        and now - entry['updated'] < LIVE_TAIL_MAX_AGE
+        and now - entry['based'] < LIVE_TAIL_REBASE
+        and end_time >= entry['end']
+    ):
+        delta_counts, delta_totals = split_rows(
+            await _fetch_rows(delta_query, (unit_name, entry['end'], end_time))
+        )
+        counts = dict(entry['counts'])
+        for model_key, (success, fail) in delta_counts.items():
+            prev_success, prev_fail = counts.get(model_key, (0, 0))
+            counts[model_key] = (prev_success + success, prev_fail + fail)
+        totals = (entry['totals'][0] + delta_totals[0], entry['totals'][1] + delta_totals[1])
+        based = entry['based']
+    else:
+        counts, totals = split_rows(
+            await _fetch_rows(query, (unit_name, start_time, end_time))
+        )
+        based = now
+
+    # Only publish if no concurrent caller advanced the entry meanwhile;
+    # otherwise this result is still correct for the caller, just not stored.
+    if _live_tail.get(key) is entry:
+        _live_tail[key] = {'end': end_time, 'counts': counts, 'totals': totals, 'updated': now, 'based': based}
+        _live_tail.move_to_end(key)
+        if len(_live_tail) > LIVE_TAIL_MAXSIZE:
+            _live_tail.popitem(last=False)
+
+    return counts, totals
+
+
+def _build_model(model, success, fail, target):
+    """Base per-model dict from one grouped row; performance is filled in by the caller."""
+    return {
+        'model': model,
+        'success_qty': success,
+        'fail_qty': fail,
+        'target': target,
+        'total_qty': success,  # Reverted: User wants this to be success only
+        'quality': success / (success + fail) if (success + fail) > 0 else 0,
+        'performance': None,
+        'oee': None
+    }
+
+
+async def get_production_data_hourly(unit_name, start_time, end_time, is_live=False):
+    """
+    Per-hour model breakdown for [start_time, end_time] in a single round trip.
+
+    Rows are bucketed by clock hour on the server. Returns a dict mapping each
+    hour start (TIMEZONE-aware) to its list of model dicts; hours without
+    production are absent. Performance is left to the caller, which knows
+    each bucket's boundaries and break time.
+    is_live=True marks end_time as "now" on a window that will be asked for
+    again with a later end, so only rows past the previous end are queried.
+    Like get_production_data, a live read stops 2 seconds short of now so
+    rows still being committed are not skipped by the next delta.
+    """
+    start_time, end_time, _ = _resolve_window(start_time, end_time, end_time if is_live else None, is_live)
+    if is_live:
+        counts, _ = await _fetch_live_counts(
+            _HOURLY_QUERY, _HOURLY_DELTA_QUERY, _split_hourly_rows, unit_name, start_time, end_time
+        )
+    else:
+        counts, _ = _split_hourly_rows(
+            await _fetch_rows_cached(_HOURLY_QUERY, (unit_name, start_time, end_time))
+        )
+
+    buckets = {}
+    for (hour_bucket, model, target), (success, fail) in counts.items():
+        hour_start = hour_bucket.replace(tzinfo=TIMEZONE)
+        buckets.setdefault(hour_start, []).append(_build_model(model, success, fail, target))
+
+    return buckets
+
+
+def ensure_tz(dt):
+    """
+    Return dt in TIMEZONE. Naive values are taken to already be local time.
+
+    TIMEZONE is a module singleton, so the common case (already converted by
+    the endpoint) is a single identity check with no new datetime built.
+    """
+    if dt.tzinfo is not TIMEZONE:
+        dt = dt.replace(tzinfo=TIMEZONE) if dt.tzinfo is None else dt.astimezone(TIMEZONE)
+    return dt
+
+
+def _resolve_window(start_time, end_time, current_time, is_live):
+    """
+    Localize the inputs and work out the query/operation-time boundaries.
+
+    Returns (start_time, final_query_end_time, actual_end_time).
+    """
+    if current_time:
+        current_time = ensure_tz(current_time)
+    start_time = ensure_tz(start_time)
+    end_time = ensure_tz(end_time)
 
     # Determine the query boundary
     # If is_live is True, we always query up to current_time (now)
@@ -170,77 +511,113 @@ async def get_production_data(unit_name, start_time, end_time, current_time=None
         final_query_end_time = final_query_end_time - timedelta(seconds=2)
         actual_end_time = final_query_end_time
 
-    table_name = "ProductRecordLogView"
+    return start_time, final_query_end_time, actual_end_time
 
-    query = f"""
-    SELECT
-        Model,
-        SUM(CASE WHEN TestSonucu = 1 THEN 1 ELSE 0 END) as SuccessQty,
-        SUM(CASE WHEN TestSonucu = 0 THEN 1 ELSE 0 END) as FailQty,
-        ModelSuresiSN as Target
-    FROM
-        {table_name}
-    WHERE
-        UnitName = ?
-        AND KayitTarihi BETWEEN ? AND ?
-    GROUP BY
-        Model, ModelSuresiSN
-    """
-
-    async with _pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(query, (unit_name, start_time, final_query_end_time))
-            all_rows = await cursor.fetchall()
-
-    # --- Business logic (pure computation, unchanged) ---
 
+def _build_results(model_rows, start_time, actual_end_time, working_mode):
+    """Per-model dicts with theoretical qty and performance from (Model, Success, Fail, Target) rows."""
     operation_time_total = (actual_end_time - start_time).total_seconds()
     break_time = calculate_break_time(start_time, actual_end_time, working_mode)
     operation_time = max(operation_time_total - break_time, 0)
     operation_time_hours = operation_time / 3600
 
+    # Single pass: a model's performance only depends on its own target, so
+    # theoretical qty and performance are filled in as each row is built.
     results = []
-    models_with_target = []
+    for model, success, fail, target in model_rows:
+        model_data = _build_model(model, success, fail, target)
 
-    for row in all_rows:
-        success = row[1]
-        fail = row[2]
-        model_data = {
-            'model': row[0],
-            'success_qty': success,
-            'fail_qty': fail,
-            'target': row[3],
-            'total_qty': success,  # Reverted: User wants this to be success only
-            'quality': success / (success + fail) if (success + fail) > 0 else 0,
-            'performance': None,
-            'oee': None
-        }
-
-        if row[3] is not None and row[3] > 0:
-            individual_theoretical_qty = operation_time_hours * row[3]
+        if target is not None and target > 0:
+            individual_theoretical_qty = operation_time_hours * target
             model_data['theoretical_qty'] = individual_theoretical_qty
-            models_with_target.append(model_data)
+            if individual_theoretical_qty > 0:
+                model_data['performance'] = success / individual_theoretical_qty
+            else:
+                model_data['performance'] = 0
         else:
             model_data['theoretical_qty'] = 0
 
         results.append(model_data)
 
-    if models_with_target:
-        for model_data in results:
-            if model_data['target'] is not None and model_data['target'] > 0:
-                individual_theoretical_qty = operation_time_hours * model_data['target']
-                model_data['theoretical_qty'] = individual_theoretical_qty
+    return results
 
-                if individual_theoretical_qty > 0:
-                    model_data['performance'] = model_data['total_qty'] / individual_theoretical_qty
-                else:
-                    model_data['performance'] = 0
-            else:
-                model_data['theoretical_qty'] = 0
-                model_data['performance'] = None
+
+async def get_production_data(unit_name, start_time, end_time, current_time=None, is_live=False, working_mode='mode1',
+                              with_totals=False):
+    """
+    Per-model production data for a unit over [start_time, end_time].
+
+    with_totals=True returns (models, totals), where totals is
+    {'success_qty', 'fail_qty'} read from the query's grand-total row
+    instead of summed in Python.
+    """
+    start_time, final_query_end_time, actual_end_time = _resolve_window(
+        start_time, end_time, current_time, is_live
+    )
+
+    if is_live and current_time:
+        counts, (total_success, total_fail) = await _fetch_live_counts(
+            _MODEL_QUERY, _MODEL_DELTA_QUERY, _split_model_rows, unit_name, start_time, final_query_end_time
+        )
     else:
-        for model_data in results:
-            if model_data['target'] is not None and model_data['target'] > 0:
-                model_data['performance'] = 0
+        counts, (total_success, total_fail) = _split_model_rows(
+            await _fetch_rows_cached(_MODEL_QUERY, (unit_name, start_time, final_query_end_time))
+        )
+
+    totals = {'success_qty': total_success, 'fail_qty': total_fail}
+    model_rows = [(model, success, fail, target) for (model, target), (success, fail) in counts.items()]
+
+    results = _build_results(model_rows, start_time, actual_end_time, working_mode)
 
+    if with_totals:
+        return results, totals
     return results
+
+
+async def get_production_data_multi(unit_names, start_time, end_time, current_time=None, is_live=False,
+                                    working_mode='mode1', summary_only=False):
+    """
+    Production data for several units in a single round trip.
+
+    Returns {unit_name: (models, totals)} with the same shapes as
+    get_production_data(with_totals=True), or {unit_name: totals} with
+    summary_only=True.
+    Units without production get empty models and zero totals. Results are
+    keyed by the caller's unit names, however the stored names are spelled.
+    """
+    start_time, final_query_end_time, actual_end_time = _resolve_window(
+        start_time, end_time, current_time, is_live
+    )
+
+    # A name listed twice would join every matching row twice
+    requested = list(dict.fromkeys(unit_names))
+    placeholders = ",".join(["(?)"] * len(requested))
+    params = (*requested, start_time, final_query_end_time)
+
+    if summary_only:
+        query = _MULTI_SUMMARY_QUERY_TEMPLATE.format(placeholders=placeholders)
+        all_rows = await _fetch_rows(query, params, len(requested))
+
+        summaries = {unit_name: {'success_qty': 0, 'fail_qty': 0} for unit_name in unit_names}
+        for row in all_rows:
+            summaries[row[0]] = {'success_qty': row[1] or 0, 'fail_qty': row[2] or 0}
+        return summaries
+
+    query = _MULTI_MODEL_QUERY_TEMPLATE.format(placeholders=placeholders)
+    all_rows = await _fetch_rows_cached(query, params, len(requested))
+
+    totals_by_unit = {unit_name: {'success_qty': 0, 'fail_qty': 0} for unit_name in unit_names}
+    rows_by_unit = {unit_name: [] for unit_name in unit_names}
+    for row in all_rows:
+        if row[5]:
+            totals_by_unit[row[0]] = {'success_qty': row[2] or 0, 'fail_qty': row[3] or 0}
+        else:
+            rows_by_unit[row[0]].append(row[1:5])
+
+    return {
+        unit_name: (
+            _build_results(rows_by_unit[unit_name], start_time, actual_end_time, working_mode),
+            totals_by_unit[unit_name],
+        )
+        for unit_name in unit_names
+    }
@@ -1,18 +1,66 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, HTMLResponse
+from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager
+from functools import lru_cache
+from operator import itemgetter
 from datetime import datetime, timedelta
-import json
 import asyncio
+import hashlib
+import logging
+import logging.handlers
+import math
+import orjson
 import os
+import queue
 import time
-import traceback
-from typing import List, Dict
+from typing import Dict, Optional, Set
 
 import database
-from database import get_production_units, get_production_data, TIMEZONE, calculate_break_time
+from database import (
+    get_production_units, get_production_data, get_production_data_hourly, get_production_data_multi,
+    TIMEZONE, ensure_tz, calculate_break_time, calculate_break_times,
+)
+
+
+# ---------------------------------------------------------------------------
+# Logging: handlers run on a QueueListener thread, so a log call from the
+# event loop only enqueues the record instead of writing to stdout.
+# Set LOG_LEVEL=DEBUG to see per-push / per-query messages.
+# ---------------------------------------------------------------------------
+
+logger = logging.getLogger("dashboard")
+
+
+def _configure_logging() -> queue.SimpleQueue:
+    """
+    Route "dashboard" records into a queue and return it.
+
+    The logger outlives this module, so a re-import finds the QueueHandler
+    already installed and reuses its queue instead of adding another one.
+    """
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+    for handler in logger.handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            return handler.queue
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    return log_queue
+
+
+# Records logged before startup wait in the queue until the listener runs
+_log_queue = _configure_logging()
+
+
+def _start_log_listener() -> logging.handlers.QueueListener:
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(_log_queue, stream_handler)
+    listener.start()
+    return listener
 
 
 # ---------------------------------------------------------------------------
@@ -21,9 +69,15 @@ from database import get_production_units, get_production_data, TIMEZONE, calcul
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await database.init_pool()
-    yield
-    await database.close_pool()
+    # Started per app run, so a second lifespan (e.g. a reused test client)
+    # gets its own listener draining the queue
+    log_listener = _start_log_listener()
+    try:
+        await database.init_pool()
+        yield
+        await database.close_pool()
+    finally:
+        log_listener.stop()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -61,7 +115,7 @@ VANILLA_DIR = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "frontend")
 )
 
-print(f"React Frontend directory: {FRONTEND_DIR}")
+logger.info("React Frontend directory: %s", FRONTEND_DIR)
 
 if os.path.exists(os.path.join(FRONTEND_DIR, "assets")):
     app.mount("/assets", StaticFiles(directory=os.path.join(FRONTEND_DIR, "assets")), name="assets")
@@ -69,6 +123,14 @@ if os.path.exists(os.path.join(FRONTEND_DIR, "assets")):
 if os.path.exists(VANILLA_DIR):
     app.mount("/legacy", StaticFiles(directory=VANILLA_DIR), name="legacy")
 
+# The built bundle does not change while the server runs: list its files once
+# (as URL paths) so the SPA catch-all never stats the filesystem per request
+FRONTEND_FILES = frozenset(
+    os.path.relpath(os.path.join(root, name), FRONTEND_DIR).replace(os.sep, "/")
+    for root, _, names in os.walk(FRONTEND_DIR)
+    for name in names
+)
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -83,35 +145,104 @@ def _is_normal_ws_close(error: Exception) -> bool:
     ))
 
 
-def _parse_ws_params(params: dict):
-    """Extract and timezone-convert start/end/working_mode from a WS message."""
-    start_time_str = params['start_time'].replace('Z', '+00:00')
-    end_time_str = params['end_time'].replace('Z', '+00:00')
-    working_mode = params.get('working_mode', 'mode1')
+def _ws_encode(payload: dict) -> bytes:
+    """Encode payload for a binary JSON frame (decoded by useDashboardData)."""
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+
+async def _ws_send(websocket: WebSocket, payload: dict):
+    """Send payload as a binary JSON frame encoded with orjson."""
+    await websocket.send_bytes(_ws_encode(payload))
+
+
+def _drain(outbox: asyncio.Queue):
+    """Drop a payload the sender task hasn't picked up yet."""
+    while not outbox.empty():
+        outbox.get_nowait()
+
+
+def _queue_latest(outbox: asyncio.Queue, data: bytes):
+    """Queue data for the sender task, replacing any payload it hasn't picked up yet."""
+    try:
+        outbox.put_nowait(data)
+    except asyncio.QueueFull:
+        outbox.get_nowait()
+        outbox.put_nowait(data)
 
-    start_time = datetime.fromisoformat(start_time_str)
-    end_time = datetime.fromisoformat(end_time_str)
 
-    if start_time.tzinfo is not None:
-        start_time = start_time.astimezone(TIMEZONE)
-        end_time = end_time.astimezone(TIMEZONE)
+async def _send_queued(websocket: WebSocket, outbox: asyncio.Queue):
+    """
+    Sender task: write queued payloads to the socket.
 
-    return start_time, end_time, working_mode
+    The outbox holds at most one payload, so a slow client only ever receives
+    the newest snapshot and never holds up the push loop's next query.
+    """
+    while True:
+        data = await outbox.get()
+        await websocket.send_bytes(data)
+
+
+@lru_cache(maxsize=1024)
+def _parse_iso(value: str) -> datetime:
+    """
+    Parse an ISO timestamp into a TIMEZONE-aware datetime.
+
+    Values with an offset are converted; naive values are taken as local time.
+    The trailing 'Z' of JS toISOString() values is rewritten because
+    fromisoformat only accepts it from Python 3.11 on. Memoized because
+    clients resend the same start/end strings on every connect and param
+    update; datetimes are immutable, so sharing is safe.
+    """
+    return ensure_tz(datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+
+@lru_cache(maxsize=4096)
+def _iso(ts: int) -> str:
+    """ISO string for an hour boundary given as epoch seconds (memoized per hour)."""
+    return datetime.fromtimestamp(ts, TIMEZONE).isoformat()
+
+
+_get_ws_range = itemgetter('start_time', 'end_time')
+
+
+def _parse_ws_params(params: dict):
+    """Extract and timezone-convert start/end/working_mode from a WS message."""
+    start_raw, end_raw = _get_ws_range(params)
+    return _parse_iso(start_raw), _parse_iso(end_raw), params.get('working_mode', 'mode1')
 
 
 def _parse_time_params(start_time_raw: str, end_time_raw: str):
     """Parse ISO time strings from REST query params."""
-    start_str = start_time_raw.replace('Z', '+00:00')
-    end_str = end_time_raw.replace('Z', '+00:00')
+    return _parse_iso(start_time_raw), _parse_iso(end_time_raw)
+
+
+def _settled_etag(request: Request, response: Response, unit_name: str,
+                  start_dt: datetime, end_dt: datetime, working_mode: str) -> Optional[Response]:
+    """
+    Conditional-GET handling for historical windows.
 
-    start_time = datetime.fromisoformat(start_str)
-    end_time = datetime.fromisoformat(end_str)
+    Once a window has settled (ended more than SETTLED_AFTER ago) its
+    response never changes, so it gets an ETag derived from the request
+    parameters plus a long Cache-Control. Returns a 304 response when the
+    client already holds that ETag, otherwise None (headers are set on
+    `response` for the normal reply). Live windows get no caching headers.
+    """
+    if end_dt >= datetime.now(TIMEZONE) - database.SETTLED_AFTER:
+        return None
 
-    if start_time.tzinfo is not None:
-        start_time = start_time.astimezone(TIMEZONE)
-        end_time = end_time.astimezone(TIMEZONE)
+    key = f"{request.url.path}|{unit_name}|{start_dt.isoformat()}|{end_dt.isoformat()}|{working_mode}"
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=86400'}
 
-    return start_time, end_time
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and (
+        if_none_match.strip() == '*'
+        or any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+    ):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
 
 
 # ---------------------------------------------------------------------------
@@ -120,27 +251,34 @@ def _parse_time_params(start_time_raw: str, end_time_raw: str):
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {
-            'standard': [],
-            'hourly': [],
+        self.active_connections: Dict[str, Set[WebSocket]] = {
+            'standard': set(),
+            'hourly': set(),
         }
 
     async def connect(self, websocket: WebSocket, connection_type: str = 'standard'):
         await websocket.accept()
-        if connection_type not in self.active_connections:
-            self.active_connections[connection_type] = []
-        self.active_connections[connection_type].append(websocket)
+        self.active_connections.setdefault(connection_type, set()).add(websocket)
 
     def disconnect(self, websocket: WebSocket, connection_type: str = 'standard'):
         if connection_type in self.active_connections:
-            conns = self.active_connections[connection_type]
-            if websocket in conns:
-                conns.remove(websocket)
-
-    async def broadcast(self, message: str, connection_type: str = 'standard'):
-        if connection_type in self.active_connections:
-            for connection in self.active_connections[connection_type]:
-                await connection.send_text(message)
+            self.active_connections[connection_type].discard(websocket)
+
+    async def broadcast(self, payload: dict, connection_type: str = 'standard'):
+        """
+        Serialize payload once and send it to all connections concurrently;
+        drop any connection whose send fails.
+        """
+        data = _ws_encode(payload)
+        # Snapshot so connects/disconnects during the sends don't affect iteration
+        conns = list(self.active_connections.get(connection_type, ()))
+        results = await asyncio.gather(
+            *(connection.send_bytes(data) for connection in conns),
+            return_exceptions=True,
+        )
+        for connection, result in zip(conns, results):
+            if isinstance(result, Exception):
+                self.disconnect(connection, connection_type)
 
 
 manager = ConnectionManager()
@@ -156,8 +294,14 @@ async def get_units():
 
 
 @app.get("/report-data")
-async def get_report_data(units: str, start_time: str, end_time: str, working_mode: str = 'mode1', is_live: bool = False):
-    """Aggregated report data for multiple units with weighted performance."""
+async def get_report_data(units: str, start_time: str, end_time: str, working_mode: str = 'mode1', is_live: bool = False,
+                          include_models: bool = True):
+    """
+    Aggregated report data for multiple units with weighted performance.
+
+    include_models=false skips the per-model breakdown (and with it the
+    per-model performance sum) and fetches only the unit totals.
+    """
     try:
         unit_list = [u.strip() for u in units.split(',') if u.strip()]
         if not unit_list:
@@ -174,30 +318,41 @@ async def get_report_data(units: str, start_time: str, end_time: str, working_mo
         total_production_all = 0
         total_success_weight = 0
 
-        for unit_name in unit_list:
-            print(f"[REPORT] Starting async query for unit {unit_name}")
-            try:
-                production_data = await asyncio.wait_for(
-                    get_production_data(unit_name, start_dt, end_dt, current_time, is_live, working_mode),
-                    timeout=30.0,
-                )
-                print(f"[REPORT] Query completed for unit {unit_name}")
-            except asyncio.TimeoutError:
-                print(f"[REPORT ERROR] Timeout for unit {unit_name}")
-                raise HTTPException(status_code=504, detail=f"Database timeout for unit {unit_name}")
-            except Exception as db_error:
-                print(f"[REPORT ERROR] DB error for unit {unit_name}: {db_error}")
-                raise HTTPException(status_code=500, detail=str(db_error))
+        # One query for all units instead of one query per unit
+        logger.debug("[REPORT] Starting async query for %d units", len(unit_list))
+        try:
+            results = await asyncio.wait_for(
+                get_production_data_multi(
+                    unit_list, start_dt, end_dt, current_time, is_live, working_mode,
+                    summary_only=not include_models,
+                ),
+                timeout=30.0,
+            )
+            logger.debug("[REPORT] Query completed for %d units", len(unit_list))
+        except asyncio.TimeoutError:
+            logger.error("[REPORT ERROR] Timeout for units %s", unit_list)
+            raise HTTPException(status_code=504, detail="Database timeout for report units")
+        except Exception as db_error:
+            logger.error("[REPORT ERROR] DB error for units %s: %s", unit_list, db_error)
+            raise HTTPException(status_code=500, detail=str(db_error))
 
-            unit_success = sum(m['success_qty'] for m in production_data)
-            unit_fail = sum(m['fail_qty'] for m in production_data)
+        for unit_name in unit_list:
+            if include_models:
+                production_data, totals = results[unit_name]
+                unit_performance_sum = 0
+                for m in production_data:
+                    performance = m['performance']
+                    if performance is not None:
+                        unit_performance_sum += performance
+            else:
+                production_data, totals = [], results[unit_name]
+                unit_performance_sum = 0
+
+            unit_success = totals['success_qty']
+            unit_fail = totals['fail_qty']
             unit_total = unit_success + unit_fail
             unit_quality = unit_success / unit_total if unit_total > 0 else 0
 
-            unit_performance_sum = sum(
-                m['performance'] for m in production_data if m.get('performance') is not None
-            )
-
             unit_data[unit_name] = {
                 'total_success': unit_success,
                 'total_fail': unit_fail,
@@ -234,57 +389,68 @@ async def get_report_data(units: str, start_time: str, end_time: str, working_mo
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in report data endpoint: {e}")
-        traceback.print_exc()
+        logger.exception("Error in report data endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/historical-data/{unit_name}")
-async def get_historical_data(unit_name: str, start_time: str, end_time: str, working_mode: str = 'mode1'):
+async def get_historical_data(unit_name: str, start_time: str, end_time: str, request: Request, response: Response,
+                              working_mode: str = 'mode1'):
     try:
         start_dt, end_dt = _parse_time_params(start_time, end_time)
+        not_modified = _settled_etag(request, response, unit_name, start_dt, end_dt, working_mode)
+        if not_modified is not None:
+            return not_modified
         current_time = datetime.now(TIMEZONE)
 
-        print(f"[HISTORICAL] Starting async query for unit {unit_name}")
+        logger.debug("[HISTORICAL] Starting async query for unit %s", unit_name)
         try:
-            production_data = await asyncio.wait_for(
-                get_production_data(unit_name, start_dt, end_dt, current_time, False, working_mode),
+            production_data, totals = await asyncio.wait_for(
+                get_production_data(unit_name, start_dt, end_dt, current_time, False, working_mode, with_totals=True),
                 timeout=30.0,
             )
-            print(f"[HISTORICAL] Query completed for unit {unit_name}")
+            logger.debug("[HISTORICAL] Query completed for unit %s", unit_name)
         except asyncio.TimeoutError:
             raise HTTPException(status_code=504, detail="Database query timeout - try a smaller time range")
         except Exception as db_error:
             raise HTTPException(status_code=500, detail=f"Database error: {db_error}")
 
-        total_success = sum(m['success_qty'] for m in production_data)
-        total_fail = sum(m['fail_qty'] for m in production_data)
-        total_qty = sum(m['total_qty'] for m in production_data)
+        total_success = totals['success_qty']
+        total_fail = totals['fail_qty']
+        total_qty = total_success  # total_qty counts successful units only
 
         total_processed = total_success + total_fail
         total_quality = total_success / total_processed if total_processed > 0 else 0
 
-        models_with_target = [m for m in production_data if m['target'] and m['target'] > 0]
+        # Single pass over the models for every per-model aggregate
+        has_target = False
+        total_actual_qty = 0
+        target_qty_sum = 0  # sum of total_qty * target over models with a target
+        unit_performance_sum = 0
+        for m in production_data:
+            target = m['target']
+            if target and target > 0:
+                qty = m['total_qty']
+                has_target = True
+                total_actual_qty += qty
+                target_qty_sum += qty * target
+            performance = m['performance']
+            if performance is not None:
+                unit_performance_sum += performance
+
         total_performance = None
         total_theoretical_qty = 0
 
-        if models_with_target:
+        if has_target:
             operation_time_total = (end_dt - start_dt).total_seconds()
             break_time = calculate_break_time(start_dt, end_dt, working_mode)
             operation_time = max(operation_time_total - break_time, 0)
 
-            total_actual_qty = sum(m['total_qty'] for m in models_with_target)
             if total_actual_qty > 0:
-                weighted_target_rate = sum(
-                    (m['total_qty'] / total_actual_qty) * m['target'] for m in models_with_target
-                )
+                weighted_target_rate = target_qty_sum / total_actual_qty
                 total_theoretical_qty = (operation_time / 3600) * weighted_target_rate
                 total_performance = total_actual_qty / total_theoretical_qty if total_theoretical_qty > 0 else 0
 
-        unit_performance_sum = sum(
-            m['performance'] for m in production_data if m.get('performance') is not None
-        )
-
         return {
             'unit_name': unit_name,
             'total_success': total_success,
@@ -303,38 +469,61 @@ async def get_historical_data(unit_name: str, start_time: str, end_time: str, wo
 
 
 @app.get("/historical-hourly-data/{unit_name}")
-async def get_historical_hourly_data(unit_name: str, start_time: str, end_time: str, working_mode: str = 'mode1'):
+async def get_historical_hourly_data(unit_name: str, start_time: str, end_time: str, request: Request,
+                                     response: Response, working_mode: str = 'mode1'):
     try:
         start_dt, end_dt = _parse_time_params(start_time, end_time)
-        current_time = datetime.now(TIMEZONE)
+        not_modified = _settled_etag(request, response, unit_name, start_dt, end_dt, working_mode)
+        if not_modified is not None:
+            return not_modified
 
         hourly_data = []
-        current_hour = start_dt.replace(minute=0, second=0, microsecond=0)
         total_success = 0
         total_fail = 0
         total_qty = 0
+        total_theoretical_qty = 0
 
+        hours = []
+        current_hour = start_dt.replace(minute=0, second=0, microsecond=0)
         while current_hour < end_dt:
             hour_end = min(current_hour + timedelta(hours=1), end_dt)
+            hours.append((current_hour, hour_end))
+            current_hour = hour_end
 
-            print(f"[HISTORICAL HOURLY] Async query for {unit_name}, hour {current_hour.strftime('%H:%M')}")
+        # One grouped query for the whole range instead of one query per hour
+        buckets = {}
+        if hours:
+            logger.debug("[HISTORICAL HOURLY] Async query for %s, %d hours", unit_name, len(hours))
             try:
-                hour_data = await asyncio.wait_for(
-                    get_production_data(unit_name, current_hour, hour_end, current_time, False, working_mode),
+                buckets = await asyncio.wait_for(
+                    get_production_data_hourly(unit_name, hours[0][0], end_dt),
                     timeout=30.0,
                 )
             except asyncio.TimeoutError:
-                print(f"[HISTORICAL HOURLY ERROR] Timeout for {unit_name} hour {current_hour.strftime('%H:%M')} - skipping")
-                current_hour = hour_end
-                continue
+                raise HTTPException(status_code=504, detail="Database query timeout - try a smaller time range")
             except Exception as db_error:
-                print(f"[HISTORICAL HOURLY ERROR] DB error for {unit_name} hour {current_hour.strftime('%H:%M')}: {db_error} - skipping")
-                current_hour = hour_end
-                continue
-
-            hour_success = sum(m['success_qty'] for m in hour_data)
-            hour_fail = sum(m['fail_qty'] for m in hour_data)
-            hour_total = sum(m['total_qty'] for m in hour_data)
+                raise HTTPException(status_code=500, detail=f"Database error: {db_error}")
+
+        # Break time for every hour in one batch (pure arithmetic, no I/O)
+        hour_breaks = calculate_break_times(hours, working_mode)
+
+        for (current_hour, hour_end), hour_break in zip(hours, hour_breaks):
+            hour_success = 0
+            hour_fail = 0
+            hour_total = 0
+            has_target = False
+            hour_actual_qty = 0
+            target_qty_sum = 0
+            for m in buckets.get(current_hour, ()):
+                qty = m['total_qty']
+                hour_success += m['success_qty']
+                hour_fail += m['fail_qty']
+                hour_total += qty
+                target = m['target']
+                if target and target > 0:
+                    has_target = True
+                    hour_actual_qty += qty
+                    target_qty_sum += qty * target
 
             total_success += hour_success
             total_fail += hour_fail
@@ -342,23 +531,20 @@ async def get_historical_hourly_data(unit_name: str, start_time: str, end_time:
 
             hour_quality = hour_success / (hour_success + hour_fail) if (hour_success + hour_fail) > 0 else 0
 
-            models_with_target = [m for m in hour_data if m['target'] and m['target'] > 0]
             hour_performance = 0
             hour_theoretical_qty = 0
 
-            if models_with_target:
+            if has_target:
                 hour_op_time = (hour_end - current_hour).total_seconds()
-                hour_break = calculate_break_time(current_hour, hour_end, working_mode)
                 hour_op_time = max(hour_op_time - hour_break, 0)
 
-                hour_actual_qty = sum(m['total_qty'] for m in models_with_target)
                 if hour_actual_qty > 0:
-                    weighted_rate = sum(
-                        (m['total_qty'] / hour_actual_qty) * m['target'] for m in models_with_target
-                    )
+                    weighted_rate = target_qty_sum / hour_actual_qty
                     hour_theoretical_qty = (hour_op_time / 3600) * weighted_rate
                     hour_performance = hour_actual_qty / hour_theoretical_qty if hour_theoretical_qty > 0 else 0
 
+            total_theoretical_qty += hour_theoretical_qty
+
             hourly_data.append({
                 'hour_start': current_hour.isoformat(),
                 'hour_end': hour_end.isoformat(),
@@ -369,10 +555,8 @@ async def get_historical_hourly_data(unit_name: str, start_time: str, end_time:
                 'performance': hour_performance,
                 'theoretical_qty': hour_theoretical_qty,
             })
-            current_hour = hour_end
 
         total_quality = total_success / (total_success + total_fail) if (total_success + total_fail) > 0 else 0
-        total_theoretical_qty = sum(h['theoretical_qty'] for h in hourly_data)
         total_performance = total_qty / total_theoretical_qty if total_theoretical_qty > 0 else 0
 
         return {
@@ -385,9 +569,10 @@ async def get_historical_hourly_data(unit_name: str, start_time: str, end_time:
             'total_theoretical_qty': total_theoretical_qty,
             'hourly_data': hourly_data,
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in historical hourly data endpoint: {e}")
-        traceback.print_exc()
+        logger.exception("Error in historical hourly data endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -396,375 +581,604 @@ async def get_historical_hourly_data(unit_name: str, start_time: str, end_time:
 # ===================================================================
 
 PUSH_INTERVAL = 12  # seconds between pushes
-
-
-@app.websocket("/ws/{unit_name}")
-async def websocket_endpoint(websocket: WebSocket, unit_name: str):
-    """Standard dashboard -- server pushes fresh data every PUSH_INTERVAL seconds."""
-    await manager.connect(websocket, 'standard')
+LIVE_WINDOW = timedelta(minutes=5)  # an end_time this close to now is treated as live
+COALESCE_TTL = 6  # seconds a live query result is shared between dashboards
+
+# Live query results shared by every dashboard on the same window:
+# key -> Future of the models list, and when that Future was started
+_shared_results: Dict[tuple, asyncio.Future] = {}
+_shared_ts: Dict[tuple, float] = {}
+
+
+async def _receive_ws_messages(websocket: WebSocket, state: dict, params_changed: asyncio.Event,
+                               params_raw: str, tag: str, unit_name: str):
+    """
+    Consume every inbound frame of one dashboard connection.
+
+    Heartbeats are answered here straight away, so they never wake the
+    connection loop. New params are stored in state['params'] and signalled
+    through params_changed. The event is also set when this task ends
+    (disconnect or bad input) so the connection loop notices and re-raises.
+    """
+    # Clients repeat identical frames (heartbeats, re-sent params):
+    # decode a frame only when it differs from the previous one
+    last_raw, last_message = None, None
     try:
-        # 1. Wait for initial parameters from client (sent once on connect)
-        raw = await websocket.receive_text()
-        params = json.loads(raw)
-        start_time, end_time, working_mode = _parse_ws_params(params)
-
-        last_success = 0
-        last_fail = 0
-        model_cache = {}
-        last_params = (start_time, end_time, working_mode)
-        # 2. Server-driven push loop
         while True:
-            current_time = datetime.now(TIMEZONE)
-
-            # --- Query DB (truly async, no executor) ---
-            try:
-                production_data = await asyncio.wait_for(
-                    get_production_data(unit_name, start_time, end_time, current_time, True, working_mode),
-                    timeout=30.0,
-                )
-            except asyncio.TimeoutError:
-                print(f"[STANDARD ERROR] DB timeout for {unit_name}")
-                if websocket.client_state.name == 'CONNECTED':
-                    await websocket.send_json({"error": "Database query timeout - try a smaller time range"})
-                await asyncio.sleep(PUSH_INTERVAL)
-                continue
-            except Exception as db_error:
-                print(f"[STANDARD ERROR] DB error for {unit_name}: {db_error}")
-                if websocket.client_state.name == 'CONNECTED':
-                    await websocket.send_json({"error": f"Database error: {db_error}"})
-                await asyncio.sleep(PUSH_INTERVAL)
-                continue
-
-            # --- Build response (with model-level monotonicity guard) ---
-            if (start_time, end_time, working_mode) != last_params:
-                model_cache.clear()
-                last_params = (start_time, end_time, working_mode)
+            msg = await websocket.receive_text()
+            if msg != last_raw:
+                last_raw, last_message = msg, orjson.loads(msg)
+            if last_message.get('heartbeat'):
+                await _ws_send(websocket, {"heartbeat": True, "timestamp": time.time()})
+            elif msg != params_raw:
+                state['params'] = _parse_ws_params(last_message)
+                params_raw = msg
+                params_changed.set()
+                logger.debug("[%s] Params updated for %s", tag, unit_name)
+    finally:
+        params_changed.set()
+
+
+def _drop_failed_result(key: tuple, future: asyncio.Future):
+    """Done-callback: forget a failed shared query so the next caller retries."""
+    if (future.cancelled() or future.exception() is not None) and _shared_results.get(key) is future:
+        del _shared_results[key]
+        del _shared_ts[key]
+
+
+async def get_production_data_coalesced(unit_name: str, start_time: datetime, end_time: datetime,
+                                        current_time: datetime, working_mode: str):
+    """
+    Live get_production_data, run at most once per COALESCE_TTL per window.
+
+    Dashboards watching the same (unit, start, end, mode) await one shared
+    query instead of each issuing their own. Callers get their own copies of
+    the model dicts because the push loops patch them in place.
+    """
+    key = (unit_name, start_time, end_time, working_mode)
+    now = time.monotonic()
+    future = _shared_results.get(key)
+    if future is None or now - _shared_ts[key] > COALESCE_TTL:
+        for stale in [k for k, ts in _shared_ts.items() if now - ts > COALESCE_TTL]:
+            del _shared_results[stale]
+            del _shared_ts[stale]
+        future = asyncio.ensure_future(
+            get_production_data(unit_name, start_time, end_time, current_time, True, working_mode)
+        )
+        future.add_done_callback(lambda f: _drop_failed_result(key, f))
+        _shared_results[key] = future
+        _shared_ts[key] = now
 
-            for m in production_data:
-                name = m.get('model', 'Unknown')
-                # Only update cache if we see more production or fail
-                if name not in model_cache:
-                    model_cache[name] = m
-                else:
-                    prev = model_cache[name]
-                    # We check both success and fail independently
-                    if m['success_qty'] > prev['success_qty'] or m['fail_qty'] > prev['fail_qty']:
-                        model_cache[name] = m
-                    else:
-                        # Ensure we don't 'regress' even if DB does
-                        m['success_qty'] = max(m['success_qty'], prev['success_qty'])
-                        m['fail_qty'] = max(m['fail_qty'], prev['fail_qty'])
-                        m['total_qty'] = m['success_qty'] # success only for production (per user rule)
-                        # Quality must be updated for the shielded model
-                        tot = m['success_qty'] + m['fail_qty']
-                        m['quality'] = m['success_qty'] / tot if tot > 0 else 0
-
-            # Recalculate totals from shielded model data
-            total_success = sum(m['success_qty'] for m in production_data)
-            total_fail = sum(m['fail_qty'] for m in production_data)
-
-            # Only allow counts to go up (or stay same) - global guard
-            total_success = max(total_success, last_success)
-            total_fail = max(total_fail, last_fail)
-
-            # Store for next iteration
-            last_success = total_success
-            last_fail = total_fail
-
-            total_qty = total_success
-            total_quality = total_success / (total_success + total_fail) if (total_success + total_fail) > 0 else 0
-
-            models_with_target = [m for m in production_data if m['target'] and m['target'] > 0]
-            total_performance = 0
-
-            if models_with_target:
-                total_actual_qty = sum(m['total_qty'] for m in models_with_target)
-                total_theoretical_qty = 0
-
-                if total_actual_qty > 0:
-                    weighted_target_rate = sum(
-                        (m['total_qty'] / total_actual_qty) * m['target'] for m in models_with_target
-                    )
+    # shield: one caller timing out must not cancel the query for the others
+    models = await asyncio.shield(future)
+    return [dict(m) for m in models]
 
-                    actual_end = end_time
-                    if current_time:
-                        if (current_time - end_time) <= timedelta(minutes=5):
-                            actual_end = current_time
 
-                    op_total = max((actual_end - start_time).total_seconds(), 0)
-                    brk = calculate_break_time(start_time, actual_end, working_mode)
-                    op_time = max(op_total - brk, 0)
-                    total_theoretical_qty = (op_time / 3600) * weighted_target_rate
+# Per-hour fallback queries in flight across *all* hourly dashboards. Capped
+# at half the DB pool so a few wide fan-outs can't starve the other sockets.
+HOURLY_QUERY_CONCURRENCY = max(1, database.POOL_MAXSIZE // 2)
+_hourly_query_limit = asyncio.Semaphore(HOURLY_QUERY_CONCURRENCY)
 
-                total_performance = total_actual_qty / total_theoretical_qty if total_theoretical_qty > 0 else 0
+# Hourly dashboard: one server-side GROUP BY hour query per tick. Set
+# USE_GROUPED_HOURLY_QUERY=0 to fall back to one query per hour.
+USE_GROUPED_HOURLY_QUERY = os.getenv("USE_GROUPED_HOURLY_QUERY", "1") != "0"
 
-            unit_performance_sum = sum(
-                m['performance'] for m in production_data if m.get('performance') is not None
-            )
 
-            response_data = {
-                'unit_name': unit_name,
-                'models': production_data,
-                'summary': {
-                    'total_success': total_success,
-                    'total_fail': total_fail,
-                    'total_qty': total_qty,
-                    'total_quality': total_quality,
-                    'total_performance': total_performance,
-                    'unit_performance_sum': unit_performance_sum,
-                },
-            }
-
-            # --- Push to client ---
-            if websocket.client_state.name != 'CONNECTED':
-                print(f"[STANDARD WARNING] Connection closed for {unit_name}")
-                break
+def _hourly_slices(start_time: datetime, end_time: datetime, current_time: datetime):
+    """
+    (hour_start, hour_end) pairs for the hourly dashboard, in order.
 
-            await websocket.send_json(response_data)
-            print(f"[STANDARD PUSH] Sent data to {unit_name}")
+    Hours start at the clock hour containing start_time. When the window is
+    live (end_time within 5 minutes of now) it runs up to current_time and
+    the open hour ends at current_time; otherwise it is cut at end_time.
+    """
+    actual_end_for_hourly = end_time
+    if current_time and abs(current_time - end_time) <= LIVE_WINDOW:
+        actual_end_for_hourly = current_time
 
-            # --- Wait for next cycle; also listen for param updates / heartbeats ---
-            try:
-                msg = await asyncio.wait_for(websocket.receive_text(), timeout=PUSH_INTERVAL)
-                new_params = json.loads(msg)
-                if new_params.get('heartbeat'):
-                    await websocket.send_json({"heartbeat": True, "timestamp": time.time()})
-                else:
-                    start_time, end_time, working_mode = _parse_ws_params(new_params)
-                    print(f"[STANDARD] Params updated for {unit_name}")
-            except asyncio.TimeoutError:
-                pass  # No client message -- just push again
+    # Hour boundaries as integer epoch seconds; each hour ends where the next
+    # starts and the last one is cut at the range end (now, when live)
+    first_hour = int(start_time.replace(minute=0, second=0, microsecond=0).timestamp())
+    hour_starts = [
+        datetime.fromtimestamp(hour_ts, TIMEZONE)
+        for hour_ts in range(first_hour, math.ceil(actual_end_for_hourly.timestamp()), 3600)
+    ]
+    return list(zip(hour_starts, hour_starts[1:] + [actual_end_for_hourly]))
 
-    except WebSocketDisconnect:
-        print(f"[STANDARD INFO] WebSocket disconnected for {unit_name}")
-    except Exception as e:
-        if not _is_normal_ws_close(e):
-            print(f"[STANDARD ERROR] Unexpected error for {unit_name}: {e}")
-            traceback.print_exc()
-    finally:
-        manager.disconnect(websocket, 'standard')
 
+# ---------------------------------------------------------------------------
+# Unit refreshers: one push loop per (dashboard kind, unit, params), shared by
+# every WebSocket watching it. DB work scales with distinct streams, not with
+# connected clients, and each payload is built and encoded once per tick.
+# ---------------------------------------------------------------------------
 
-@app.websocket("/ws/hourly/{unit_name}")
-async def hourly_websocket_endpoint(websocket: WebSocket, unit_name: str):
-    """Hourly dashboard -- server pushes fresh data every PUSH_INTERVAL seconds."""
-    await manager.connect(websocket, 'hourly')
-    try:
-        # 1. Wait for initial parameters from client
-        raw = await websocket.receive_text()
-        params = json.loads(raw)
-        start_time, end_time, working_mode = _parse_ws_params(params)
-
-        last_success = 0
-        last_fail = 0
-        hourly_cache = {}
-        last_params = (start_time, end_time, working_mode)
-        # 2. Server-driven push loop
+class UnitRefresher(ABC):
+    """Background push loop for one stream; subscribers are per-connection outboxes."""
+
+    tag = ''
+
+    def __init__(self, key: tuple, unit_name: str, start_time: datetime, end_time: datetime, working_mode: str):
+        self.key = key
+        self.unit_name = unit_name
+        self.start_time = start_time
+        self.end_time = end_time
+        self.working_mode = working_mode
+        self.subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        # Monotonic guard: totals pushed on this stream never go down
+        self.last_success = 0
+        self.last_fail = 0
+        # Last encoded payload and when it was built, replayed to late joiners
+        self._last_data: Optional[bytes] = None
+        self._last_built = 0.0
+        self._wake = asyncio.Event()
+
+    def attach(self, outbox: asyncio.Queue):
+        """
+        Add a subscriber. A payload built within the last PUSH_INTERVAL/2
+        seconds is queued to it straight away; otherwise the loop is woken
+        to build a fresh one instead of leaving it waiting for the next tick.
+        """
+        self.subscribers.add(outbox)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._log_exit)
+        elif self._last_data is not None and time.monotonic() - self._last_built < PUSH_INTERVAL / 2:
+            _queue_latest(outbox, self._last_data)
+        else:
+            self._wake.set()
+
+    def detach(self, outbox: asyncio.Queue):
+        self.subscribers.discard(outbox)
+        if not self.subscribers:
+            if self._task is not None:
+                self._task.cancel()
+            if unit_refreshers.get(self.key) is self:
+                del unit_refreshers[self.key]
+
+    def _log_exit(self, task: asyncio.Task):
+        """Done-callback: report a loop that stopped for any reason but cancellation."""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("[%s ERROR] Refresher for %s stopped", self.tag, self.unit_name,
+                         exc_info=task.exception())
+
+    async def fetch_extra(self, current_time: datetime):
+        """DB reads a stream needs besides the totals query; passed to build_payload."""
+        return None
+
+    @abstractmethod
+    def build_payload(self, production_data: list, extra, current_time: datetime) -> dict:
+        """Response dict for one tick from the query results; no I/O."""
+
+    def _broadcast(self, payload: dict):
+        data = _ws_encode(payload)
+        self._last_data, self._last_built = data, time.monotonic()
+        for outbox in self.subscribers:
+            _queue_latest(outbox, data)
+        logger.debug("[%s PUSH] Queued data for %s to %d dashboard(s)",
+                     self.tag, self.unit_name, len(self.subscribers))
+
+    async def _run(self):
         while True:
             current_time = datetime.now(TIMEZONE)
-
-            # --- Query DB for full range totals ---
             try:
-                raw_data = await asyncio.wait_for(
-                    get_production_data(unit_name, start_time, end_time, current_time, True, working_mode),
-                    timeout=30.0,
-                )
+                # --- Query DB (truly async, no executor) ---
+                try:
+                    production_data = await asyncio.wait_for(
+                        get_production_data_coalesced(self.unit_name, self.start_time, self.end_time, current_time,
+                                                      self.working_mode),
+                        timeout=30.0,
+                    )
+                except asyncio.TimeoutError:
+                    logger.error("[%s ERROR] DB timeout for %s", self.tag, self.unit_name)
+                    payload = {"error": "Database query timeout - try a smaller time range"}
+                except Exception as db_error:
+                    logger.error("[%s ERROR] DB error for %s: %s", self.tag, self.unit_name, db_error)
+                    payload = {"error": f"Database error: {db_error}"}
+                else:
+                    extra = await self.fetch_extra(current_time)
+                    payload = self.build_payload(production_data, extra, current_time)
+                self._broadcast(payload)
+            except Exception as e:
+                # A bug in building the payload: keep the stream alive for the
+                # next tick, but with the traceback
+                logger.exception("[%s ERROR] Failed to build data for %s: %s", self.tag, self.unit_name, e)
+                self._broadcast({"error": "Internal server error"})
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=PUSH_INTERVAL)
             except asyncio.TimeoutError:
-                print(f"[HOURLY ERROR] DB timeout for {unit_name}")
-                if websocket.client_state.name == 'CONNECTED':
-                    await websocket.send_json({"error": "Database query timeout - try a smaller time range"})
-                await asyncio.sleep(PUSH_INTERVAL)
-                continue
-            except Exception as db_error:
-                print(f"[HOURLY ERROR] DB error for {unit_name}: {db_error}")
-                if websocket.client_state.name == 'CONNECTED':
-                    await websocket.send_json({"error": f"Database error: {db_error}"})
-                await asyncio.sleep(PUSH_INTERVAL)
-                continue
-
-            # --- Totals from raw data (with monotonicity guard) ---
-            if (start_time, end_time, working_mode) != last_params:
-                hourly_cache.clear()
-                last_params = (start_time, end_time, working_mode)
+                pass
 
-            new_success = sum(m['success_qty'] for m in raw_data)
-            new_fail = sum(m['fail_qty'] for m in raw_data)
 
-            total_success = max(new_success, last_success)
-            total_fail = max(new_fail, last_fail)
+class StandardRefresher(UnitRefresher):
+    tag = 'STANDARD'
 
-            last_success = total_success
-            last_fail = total_fail
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.model_cache = {}
 
-            total_qty = total_success
+    def build_payload(self, production_data: list, extra, current_time: datetime) -> dict:
+        # --- Build response (with model-level monotonicity guard) ---
+        # One pass: model-level guard plus every per-model sum
+        total_success = 0
+        total_fail = 0
+        has_target = False
+        total_actual_qty = 0
+        target_qty_sum = 0
+        unit_performance_sum = 0
+        for m in production_data:
+            name = m.get('model', 'Unknown')
+            success = m['success_qty']
+            fail = m['fail_qty']
+            prev = self.model_cache.get(name)
+            # Only update cache if we see more production or fail
+            # (success and fail are checked independently)
+            if prev is None or success > prev['success_qty'] or fail > prev['fail_qty']:
+                self.model_cache[name] = m
+            else:
+                # Ensure we don't 'regress' even if DB does
+                success = max(success, prev['success_qty'])
+                fail = max(fail, prev['fail_qty'])
+                m['success_qty'] = success
+                m['fail_qty'] = fail
+                m['total_qty'] = success # success only for production (per user rule)
+                # Quality must be updated for the shielded model
+                tot = success + fail
+                m['quality'] = success / tot if tot > 0 else 0
+
+            # Totals from shielded model data
+            total_success += success
+            total_fail += fail
+            target = m['target']
+            if target and target > 0:
+                qty = m['total_qty']
+                has_target = True
+                total_actual_qty += qty
+                target_qty_sum += qty * target
+            performance = m.get('performance')
+            if performance is not None:
+                unit_performance_sum += performance
+
+        # Only allow counts to go up (or stay same) - global guard
+        total_success = max(total_success, self.last_success)
+        total_fail = max(total_fail, self.last_fail)
+
+        # Store for next iteration
+        self.last_success = total_success
+        self.last_fail = total_fail
+
+        total_qty = total_success
+        total_quality = total_success / (total_success + total_fail) if (total_success + total_fail) > 0 else 0
 
-            total_processed = total_success + total_fail
-            total_quality = total_success / total_processed if total_processed > 0 else 0
+        total_performance = 0
 
-            models_with_target = [m for m in raw_data if m['target'] and m['target'] > 0]
-            total_performance = None
-            total_oee = None
+        if has_target:
             total_theoretical_qty = 0
 
-            if models_with_target:
-                actual_end = end_time
+            if total_actual_qty > 0:
+                weighted_target_rate = target_qty_sum / total_actual_qty
+
+                actual_end = self.end_time
                 if current_time:
-                    if (current_time - end_time) <= timedelta(minutes=5):
+                    if (current_time - self.end_time) <= LIVE_WINDOW:
                         actual_end = current_time
 
-                op_total = max((actual_end - start_time).total_seconds(), 0)
-                brk = calculate_break_time(start_time, actual_end, working_mode)
+                op_total = max((actual_end - self.start_time).total_seconds(), 0)
+                brk = calculate_break_time(self.start_time, actual_end, self.working_mode)
                 op_time = max(op_total - brk, 0)
+                total_theoretical_qty = (op_time / 3600) * weighted_target_rate
 
-                total_actual_qty = sum(m['total_qty'] for m in models_with_target)
-                if total_actual_qty > 0:
-                    weighted_target_rate = sum(
-                        (m['total_qty'] / total_actual_qty) * m['target'] for m in models_with_target
+            total_performance = total_actual_qty / total_theoretical_qty if total_theoretical_qty > 0 else 0
+
+        response_data = {
+            'unit_name': self.unit_name,
+            'models': production_data,
+            'summary': {
+                'total_success': total_success,
+                'total_fail': total_fail,
+                'total_qty': total_qty,
+                'total_quality': total_quality,
+                'total_performance': total_performance,
+                'unit_performance_sum': unit_performance_sum,
+            },
+        }
+        return response_data
+
+
+class HourlyRefresher(UnitRefresher):
+    tag = 'HOURLY'
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.hourly_cache = {}
+        self.closed_hours = {}  # hour_start -> finished entry for settled hours
+
+    async def fetch_extra(self, current_time: datetime):
+        """(slices, per-slice model lists) for the hours not closed yet."""
+        slices = _hourly_slices(self.start_time, self.end_time, current_time)
+        hour_results = [()] * len(slices)
+        settled_before = current_time - database.SETTLED_AFTER
+        open_slices = [sl for sl in slices if sl[0] not in self.closed_hours]
+
+        if open_slices and USE_GROUPED_HOURLY_QUERY:
+            # Queries bucketed by hour on the server, starting at the first
+            # open hour. Hours past the settle cutoff get a full read, so an
+            # hour is only closed from complete counts; for the rest, while
+            # the range ends at now, only rows since the previous tick are read
+            range_is_live = slices[-1][1] == current_time
+            settling = [sl for sl in open_slices if sl[1] <= settled_before]
+            recent = [sl for sl in open_slices if sl[1] > settled_before]
+            reads = []
+            if settling:
+                reads.append(get_production_data_hourly(self.unit_name, settling[0][0], settling[-1][1]))
+            if recent:
+                reads.append(
+                    get_production_data_hourly(self.unit_name, recent[0][0], slices[-1][1], range_is_live)
+                )
+            try:
+                buckets = {}
+                # Recent buckets go in last: they win for the boundary hour
+                # both reads include
+                for part in await asyncio.wait_for(asyncio.gather(*reads), timeout=30.0):
+                    buckets.update(part)
+                hour_results = [buckets.get(hour_start, ()) for hour_start, _ in slices]
+            except (asyncio.TimeoutError, Exception) as db_error:
+                logger.error("[HOURLY ERROR] Hourly query failed for %s: %r", self.unit_name, db_error)
+                hour_results = [db_error] * len(slices)
+        elif open_slices:
+            # Fallback: one query per hour, run concurrently
+
+            async def fetch_hour(hour_start, hour_end):
+                if hour_start in self.closed_hours:
+                    return ()
+                # hour_end is already clamped to now for the open hour, so the
+                # query is bounded to the slice rather than run as a live window
+                async with _hourly_query_limit:
+                    return await asyncio.wait_for(
+                        get_production_data(self.unit_name, hour_start, hour_end, current_time, False, self.working_mode),
+                        timeout=30.0,
                     )
-                    total_theoretical_qty = (op_time / 3600) * weighted_target_rate
 
-                total_performance = total_actual_qty / total_theoretical_qty if total_theoretical_qty > 0 else 0
-                total_oee = None
+            hour_results = await asyncio.gather(
+                *(fetch_hour(hour_start, hour_end) for hour_start, hour_end in slices),
+                return_exceptions=True,
+            )
 
-            # --- Hourly breakdown (query per hour) ---
-            hourly_data = []
-            current_hour = start_time.replace(minute=0, second=0, microsecond=0)
+        return slices, hour_results
+
+    def build_payload(self, raw_data: list, hours: tuple, current_time: datetime) -> dict:
+        # --- Totals from raw data (with monotonicity guard) ---
+        new_success = 0
+        new_fail = 0
+        has_target = False
+        total_actual_qty = 0
+        target_qty_sum = 0
+        for m in raw_data:
+            new_success += m['success_qty']
+            new_fail += m['fail_qty']
+            target = m['target']
+            if target and target > 0:
+                qty = m['total_qty']
+                has_target = True
+                total_actual_qty += qty
+                target_qty_sum += qty * target
+
+        total_success = max(new_success, self.last_success)
+        total_fail = max(new_fail, self.last_fail)
+
+        self.last_success = total_success
+        self.last_fail = total_fail
+
+        total_qty = total_success
+
+        total_processed = total_success + total_fail
+        total_quality = total_success / total_processed if total_processed > 0 else 0
 
-            is_live_data = False
-            actual_end_for_hourly = end_time
+        total_performance = None
+        total_oee = None
+        total_theoretical_qty = 0
+
+        if has_target:
+            actual_end = self.end_time
             if current_time:
-                abs_diff = abs((current_time - end_time).total_seconds())
-                is_live_data = abs_diff <= 300  # 5 minutes
-                if is_live_data:
-                    actual_end_for_hourly = current_time
+                if (current_time - self.end_time) <= LIVE_WINDOW:
+                    actual_end = current_time
 
-            while current_hour < actual_end_for_hourly:
-                hour_end = current_hour + timedelta(hours=1)
+            op_total = max((actual_end - self.start_time).total_seconds(), 0)
+            brk = calculate_break_time(self.start_time, actual_end, self.working_mode)
+            op_time = max(op_total - brk, 0)
 
-                if is_live_data and current_hour < current_time < hour_end:
-                    hour_end = current_time
-                else:
-                    hour_end = min(hour_end, actual_end_for_hourly)
+            if total_actual_qty > 0:
+                weighted_target_rate = target_qty_sum / total_actual_qty
+                total_theoretical_qty = (op_time / 3600) * weighted_target_rate
 
-                # Async query per hour
-                try:
-                    hour_data = await asyncio.wait_for(
-                        get_production_data(unit_name, current_hour, hour_end, current_time, True, working_mode),
-                        timeout=30.0,
-                    )
-                except (asyncio.TimeoutError, Exception):
-                    if is_live_data and hour_end == current_time:
-                        current_hour = current_hour + timedelta(hours=1)
-                    else:
-                        current_hour = hour_end
-                    continue
-
-                hour_success = sum(m['success_qty'] for m in hour_data)
-                hour_fail = sum(m['fail_qty'] for m in hour_data)
-                hour_total = sum(m['total_qty'] for m in hour_data)
-
-                hour_quality = hour_success / (hour_success + hour_fail) if (hour_success + hour_fail) > 0 else 0
-
-                hour_models_target = [m for m in hour_data if m['target'] and m['target'] > 0]
-                hour_performance = 0
-                hour_theoretical_qty = 0
-
-                if hour_models_target:
-                    h_op_time = (hour_end - current_hour).total_seconds()
-                    h_brk = calculate_break_time(current_hour, hour_end, working_mode)
-                    h_op_time = max(h_op_time - h_brk, 0)
-
-                    h_actual = sum(m['total_qty'] for m in hour_models_target)
-                    if h_actual > 0:
-                        h_rate = sum(
-                            (m['total_qty'] / h_actual) * m['target'] for m in hour_models_target
-                        )
-                        hour_theoretical_qty = (h_op_time / 3600) * h_rate
-                        hour_performance = h_actual / hour_theoretical_qty if hour_theoretical_qty > 0 else 0
-
-                hd_entry = {
-                    'hour_start': current_hour.isoformat(),
-                    'hour_end': hour_end.isoformat(),
-                    'success_qty': hour_success,
-                    'fail_qty': hour_fail,
-                    'total_qty': hour_total,
-                    'quality': hour_quality,
-                    'performance': hour_performance,
-                    'oee': 0,
-                    'theoretical_qty': hour_theoretical_qty,
-                }
-
-                # Shield hourly data from drops
-                h_key = hd_entry['hour_start']
-                if h_key not in hourly_cache:
-                    hourly_cache[h_key] = hd_entry
-                else:
-                    prev_h = hourly_cache[h_key]
-                    if hd_entry['success_qty'] >= prev_h['success_qty'] and hd_entry['fail_qty'] >= prev_h['fail_qty']:
-                        hourly_cache[h_key] = hd_entry
-                    else:
-                        # Use previous counts if DB regressed
-                        hd_entry['success_qty'] = max(hd_entry['success_qty'], prev_h['success_qty'])
-                        hd_entry['fail_qty'] = max(hd_entry['fail_qty'], prev_h['fail_qty'])
-
-                hourly_data.append(hd_entry)
-
-                if is_live_data and hour_end == current_time:
-                    current_hour = current_hour + timedelta(hours=1)
-                else:
-                    current_hour = hour_end
+            total_performance = total_actual_qty / total_theoretical_qty if total_theoretical_qty > 0 else 0
+            total_oee = None
 
-            # --- Build response ---
-            total_theoretical_qty = sum(h['theoretical_qty'] for h in hourly_data)
+        # --- Hourly breakdown ---
+        hourly_data = []
+        slices, hour_results = hours
+        # Hours that ended before this are final: computed once, then reused
+        settled_before = current_time - database.SETTLED_AFTER
+
+        hours_theoretical_qty = 0
+        range_end = slices[-1][1] if slices else None
+        for (current_hour, hour_end), hour_data in zip(slices, hour_results):
+            closed_entry = self.closed_hours.get(current_hour)
+            if closed_entry is not None:
+                hourly_data.append(closed_entry)
+                hours_theoretical_qty += closed_entry['theoretical_qty']
+                continue
+            if isinstance(hour_data, BaseException):
+                continue
 
-            response_data = {
-                'unit_name': unit_name,
-                'total_success': total_success,
-                'total_fail': total_fail,
-                'total_qty': total_qty,
-                'total_quality': total_quality if total_quality is not None else 0,
-                'total_performance': total_performance if total_performance is not None else 0,
-                'total_oee': total_oee if total_oee is not None else 0,
-                'total_theoretical_qty': total_theoretical_qty if total_theoretical_qty is not None else 0,
-                'hourly_data': hourly_data,
-            }
+            hour_success = 0
+            hour_fail = 0
+            hour_total = 0
+            h_has_target = False
+            h_actual = 0
+            h_target_qty_sum = 0
+            for m in hour_data:
+                qty = m['total_qty']
+                hour_success += m['success_qty']
+                hour_fail += m['fail_qty']
+                hour_total += qty
+                target = m['target']
+                if target and target > 0:
+                    h_has_target = True
+                    h_actual += qty
+                    h_target_qty_sum += qty * target
 
-            for hd in response_data['hourly_data']:
-                if hd['quality'] is None:
-                    hd['quality'] = 0
-                if hd['performance'] is None:
-                    hd['performance'] = 0
-                if hd['oee'] is None:
-                    hd['oee'] = 0
-
-            # --- Push to client ---
-            if websocket.client_state.name != 'CONNECTED':
-                print(f"[HOURLY WARNING] Connection closed for {unit_name}")
-                break
+            hour_quality = hour_success / (hour_success + hour_fail) if (hour_success + hour_fail) > 0 else 0
 
-            await websocket.send_json(response_data)
-            print(f"[HOURLY PUSH] Sent data to {unit_name} with {len(hourly_data)} hours")
+            hour_performance = 0
+            hour_theoretical_qty = 0
 
-            # --- Wait for next cycle; also listen for param updates / heartbeats ---
-            try:
-                msg = await asyncio.wait_for(websocket.receive_text(), timeout=PUSH_INTERVAL)
-                new_params = json.loads(msg)
-                if new_params.get('heartbeat'):
-                    await websocket.send_json({"heartbeat": True, "timestamp": time.time()})
+            if h_has_target:
+                h_op_time = (hour_end - current_hour).total_seconds()
+                h_brk = calculate_break_time(current_hour, hour_end, self.working_mode)
+                h_op_time = max(h_op_time - h_brk, 0)
+
+                if h_actual > 0:
+                    h_rate = h_target_qty_sum / h_actual
+                    hour_theoretical_qty = (h_op_time / 3600) * h_rate
+                    hour_performance = h_actual / hour_theoretical_qty if hour_theoretical_qty > 0 else 0
+
+            # Hour boundaries are whole epoch hours and repeat every tick, so
+            # their strings come from _iso; only the range end (now, when
+            # live) is formatted fresh
+            hour_ts = int(current_hour.timestamp())
+            hd_entry = {
+                'hour_start': _iso(hour_ts),
+                'hour_end': _iso(hour_ts + 3600) if hour_end is not range_end else hour_end.isoformat(),
+                'success_qty': hour_success,
+                'fail_qty': hour_fail,
+                'total_qty': hour_total,
+                'quality': hour_quality,
+                'performance': hour_performance,
+                'oee': 0,
+                'theoretical_qty': hour_theoretical_qty,
+            }
+
+            # Shield hourly data from drops
+            h_key = hour_ts
+            if h_key not in self.hourly_cache:
+                self.hourly_cache[h_key] = hd_entry
+            else:
+                prev_h = self.hourly_cache[h_key]
+                if hd_entry['success_qty'] >= prev_h['success_qty'] and hd_entry['fail_qty'] >= prev_h['fail_qty']:
+                    self.hourly_cache[h_key] = hd_entry
                 else:
-                    start_time, end_time, working_mode = _parse_ws_params(new_params)
-                    print(f"[HOURLY] Params updated for {unit_name}")
-            except asyncio.TimeoutError:
-                pass
+                    # Use previous counts if DB regressed
+                    hd_entry['success_qty'] = max(hd_entry['success_qty'], prev_h['success_qty'])
+                    hd_entry['fail_qty'] = max(hd_entry['fail_qty'], prev_h['fail_qty'])
+
+            hourly_data.append(hd_entry)
+            hours_theoretical_qty += hour_theoretical_qty
+            if hour_end <= settled_before:
+                self.closed_hours[current_hour] = hd_entry
+
+        # --- Build response ---
+        # Hour entries are built with numeric quality/performance/oee
+        # (never None), so they go out as-is
+        response_data = {
+            'unit_name': self.unit_name,
+            'total_success': total_success,
+            'total_fail': total_fail,
+            'total_qty': total_qty,
+            'total_quality': total_quality,
+            'total_performance': total_performance if total_performance is not None else 0,
+            'total_oee': total_oee if total_oee is not None else 0,
+            'total_theoretical_qty': hours_theoretical_qty,
+            'hourly_data': hourly_data,
+        }
+        return response_data
+
+
+unit_refreshers: Dict[tuple, UnitRefresher] = {}
+
+
+def _subscribe(refresher_cls, unit_name: str, params: tuple, outbox: asyncio.Queue) -> UnitRefresher:
+    """Attach outbox to the refresher for (kind, unit, params), starting one if needed."""
+    key = (refresher_cls.tag, unit_name, *params)
+    refresher = unit_refreshers.get(key)
+    if refresher is None:
+        refresher = unit_refreshers[key] = refresher_cls(key, unit_name, *params)
+    refresher.attach(outbox)
+    return refresher
+
+
+async def _serve_dashboard(websocket: WebSocket, unit_name: str, connection_type: str, refresher_cls):
+    """
+    Run one dashboard connection: subscribe it to the shared refresher for its
+    params and move it to another one whenever the client sends new params.
+    """
+    tag = refresher_cls.tag
+    await manager.connect(websocket, connection_type)
+    receiver = None
+    sender = None
+    refresher = None
+    # Outbound frames go through a latest-wins outbox drained by a sender task
+    outbox = asyncio.Queue(maxsize=1)
+    try:
+        # 1. Wait for initial parameters from client (sent once on connect)
+        raw = await websocket.receive_text()
+        params = _parse_ws_params(orjson.loads(raw))
+
+        # Inbound frames (heartbeats, param updates) are handled by their own
+        # task; it and the sender both set params_changed when they stop
+        state = {'params': params}
+        params_changed = asyncio.Event()
+        receiver = asyncio.create_task(
+            _receive_ws_messages(websocket, state, params_changed, raw, tag, unit_name)
+        )
+        sender = asyncio.create_task(_send_queued(websocket, outbox))
+        sender.add_done_callback(lambda _: params_changed.set())
+
+        # 2. Server-driven pushes come from the shared refresher
+        refresher = _subscribe(refresher_cls, unit_name, params, outbox)
+        while True:
+            await params_changed.wait()
+            params_changed.clear()
+            if sender.done():
+                sender.result()  # re-raise the send error that stopped it
+                break
+            if receiver.done():
+                receiver.result()  # re-raise the disconnect / error that stopped it
+                break
+            if state['params'] != params:
+                params = state['params']
+                refresher.detach(outbox)
+                # A frame built for the old params must not follow the switch
+                _drain(outbox)
+                refresher = _subscribe(refresher_cls, unit_name, params, outbox)
 
     except WebSocketDisconnect:
-        print(f"[HOURLY INFO] WebSocket disconnected for {unit_name}")
+        logger.info("[%s INFO] WebSocket disconnected for %s", tag, unit_name)
     except Exception as e:
         if not _is_normal_ws_close(e):
-            print(f"[HOURLY ERROR] Unexpected error for {unit_name}: {e}")
-            traceback.print_exc()
+            logger.exception("[%s ERROR] Unexpected error for %s: %s", tag, unit_name, e)
     finally:
-        manager.disconnect(websocket, 'hourly')
+        if refresher is not None:
+            refresher.detach(outbox)
+        for task in (receiver, sender):
+            if task is not None:
+                task.cancel()
+        manager.disconnect(websocket, connection_type)
+
+
+@app.websocket("/ws/{unit_name}")
+async def websocket_endpoint(websocket: WebSocket, unit_name: str):
+    """Standard dashboard -- server pushes fresh data every PUSH_INTERVAL seconds."""
+    await _serve_dashboard(websocket, unit_name, 'standard', StandardRefresher)
+
+
+@app.websocket("/ws/hourly/{unit_name}")
+async def hourly_websocket_endpoint(websocket: WebSocket, unit_name: str):
+    """Hourly dashboard -- server pushes fresh data every PUSH_INTERVAL seconds."""
+    await _serve_dashboard(websocket, unit_name, 'hourly', HourlyRefresher)
 
 
 # ===================================================================
@@ -773,13 +1187,11 @@ async def hourly_websocket_endpoint(websocket: WebSocket, unit_name: str):
 
 @app.get("/{full_path:path}")
 async def serve_react_app(full_path: str):
-    file_path = os.path.join(FRONTEND_DIR, full_path)
-    if full_path and os.path.exists(file_path) and os.path.isfile(file_path):
-        return FileResponse(file_path)
+    if full_path in FRONTEND_FILES:
+        return FileResponse(os.path.join(FRONTEND_DIR, full_path))
 
-    index_path = os.path.join(FRONTEND_DIR, "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
+    if "index.html" in FRONTEND_FILES:
+        return FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
 
     vanilla_index = os.path.join(VANILLA_DIR, "index.html")
     if os.path.exists(vanilla_index):
@@ -793,4 +1205,8 @@ async def serve_react_app(full_path: str):
 
 if __name__ == "__main__":
     import uvicorn
+    # WebSocket compression is left to uvicorn, which already negotiates
+    # permessage-deflate by default. Payloads are not pre-compressed once per
+    # push: each connection keeps its own deflate context, so one compressed
+    # frame cannot be shared between clients.
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -6,6 +6,9 @@ const RECONNECT_BASE_DELAY = 1_000 // 1 second
 const RECONNECT_MAX_DELAY = 30_000 // 30 seconds
 const MAX_RECONNECT_ATTEMPTS = 20
 
+// The backend may send JSON as binary (UTF-8) frames to skip a decode/encode round trip
+const textDecoder = new TextDecoder()
+
 const useDashboardData = (viewType) => {
   const location = useLocation()
   const [data, setData] = useState(null)
@@ -98,6 +101,7 @@ const useDashboardData = (viewType) => {
       : `${wsProtocol}//${window.location.host}/ws/${encodeURIComponent(unit)}`
 
     const socket = new WebSocket(wsUrl)
+    socket.binaryType = 'arraybuffer'
 
     socket.onopen = () => {
       console.log(`[WS] Connected to ${unit}`)
@@ -123,7 +127,8 @@ const useDashboardData = (viewType) => {
     }
 
     socket.onmessage = (event) => {
-      const update = JSON.parse(event.data)
+      const raw = typeof event.data === 'string' ? event.data : textDecoder.decode(event.data)
+      const update = JSON.parse(raw)
 
       // Ignore heartbeat responses and error messages
       if (update.heartbeat) return
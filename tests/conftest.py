@@ -0,0 +1,77 @@
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+# The backend modules import each other as top-level modules (see main.py)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+
+
+class FakeProductionLog:
+    """
+    In-memory ProductRecordLogView answering the per-unit production queries.
+
+    Records carry the time they were stamped (KayitTarihi) and the time they
+    were committed; a query only sees records committed by `now`, so a row
+    stamped before a tick but committed after it can be modelled.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.records = []
+        self.queries = []
+        self.now = None
+
+    def add(self, unit_name, stamped_at, passed=True, model='M1', target=60, committed_at=None):
+        self.records.append((unit_name, model, target, stamped_at, passed, committed_at or stamped_at))
+
+    def _select(self, unit_name, start_time, end_time, start_exclusive):
+        for unit, model, target, stamped_at, passed, committed_at in self.records:
+            if unit != unit_name or (self.now is not None and committed_at > self.now):
+                continue
+            after_start = stamped_at > start_time if start_exclusive else stamped_at >= start_time
+            if after_start and stamped_at <= end_time:
+                yield model, target, stamped_at, passed
+
+    def answer(self, query, params):
+        db = self.database
+        unit_name, start_time, end_time = params
+        if query in (db._MODEL_QUERY, db._MODEL_DELTA_QUERY):
+            groups = {}
+            for model, target, _, passed in self._select(unit_name, start_time, end_time,
+                                                         query is db._MODEL_DELTA_QUERY):
+                success, fail = groups.get((model, target), (0, 0))
+                groups[(model, target)] = (success + passed, fail + (not passed))
+            rows = [(model, success, fail, target, 0) for (model, target), (success, fail) in groups.items()]
+            # The empty grouping set yields a NULL-sum row even with no matches
+            total_success = sum(success for success, _ in groups.values()) if groups else None
+            total_fail = sum(fail for _, fail in groups.values()) if groups else None
+            return rows + [(None, total_success, total_fail, None, 1)]
+        if query in (db._HOURLY_QUERY, db._HOURLY_DELTA_QUERY):
+            groups = {}
+            for model, target, stamped_at, passed in self._select(unit_name, start_time, end_time,
+                                                                  query is db._HOURLY_DELTA_QUERY):
+                # DATEADD(hour, DATEDIFF(hour, 0, KayitTarihi), 0): naive local hour
+                bucket = stamped_at.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+                success, fail = groups.get((model, bucket, target), (0, 0))
+                groups[(model, bucket, target)] = (success + passed, fail + (not passed))
+            return [(model, bucket, success, fail, target)
+                    for (model, bucket, target), (success, fail) in groups.items()]
+        raise AssertionError(f"unexpected query: {query}")
+
+    async def fetch_rows(self, query, params, n_units=1):
+        self.queries.append(query)
+        return self.answer(query, params)
+
+
+@pytest.fixture
+def production_log(monkeypatch):
+    """Route database._fetch_rows to a fresh FakeProductionLog, with empty caches."""
+    import database
+
+    log = FakeProductionLog(database)
+    monkeypatch.setattr(database, '_fetch_rows', log.fetch_rows)
+    monkeypatch.setattr(database, '_settled_rows', OrderedDict())
+    monkeypatch.setattr(database, '_live_tail', OrderedDict())
+    return log
@@ -0,0 +1,197 @@
+"""
+Query-result caching in database.py, run against an in-memory
+ProductRecordLogView (see conftest.FakeProductionLog).
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aioodbc")
+pytest.importorskip("pyodbc")
+pytest.importorskip("dotenv")
+
+import database
+from database import TIMEZONE
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# ---------------------------------------------------------------------------
+# Settled-window cache
+# ---------------------------------------------------------------------------
+
+def test_settled_window_is_queried_once(production_log):
+    start = datetime(2025, 3, 3, 8, tzinfo=TIMEZONE)
+    end = start + timedelta(hours=8)
+    production_log.add('U1', start + timedelta(minutes=5))
+    production_log.add('U1', start + timedelta(minutes=6), passed=False)
+
+    first = run(database.get_production_data('U1', start, end))
+    second = run(database.get_production_data('U1', start, end))
+
+    assert first == second
+    assert (first[0]['success_qty'], first[0]['fail_qty']) == (1, 1)
+    assert production_log.queries == [database._MODEL_QUERY]
+
+
+def test_recent_window_is_not_cached(production_log):
+    end = datetime.now(TIMEZONE)
+    start = end - timedelta(hours=1)
+
+    run(database.get_production_data('U1', start, end))
+    production_log.add('U1', end - timedelta(minutes=1))
+    models = run(database.get_production_data('U1', start, end))
+
+    assert [m['success_qty'] for m in models] == [1]
+    assert len(production_log.queries) == 2
+
+
+def test_settled_cache_evicts_least_recently_used(production_log, monkeypatch):
+    monkeypatch.setattr(database, 'SETTLED_CACHE_MAXSIZE', 2)
+    day = datetime(2025, 3, 3, tzinfo=TIMEZONE)
+    windows = [(day + timedelta(hours=h), day + timedelta(hours=h + 1)) for h in range(3)]
+
+    for start, end in windows[:2]:
+        run(database.get_production_data('U1', start, end))
+    run(database.get_production_data('U1', *windows[0]))  # refresh the first window
+    run(database.get_production_data('U1', *windows[2]))  # evicts the second
+    assert len(production_log.queries) == 3
+
+    run(database.get_production_data('U1', *windows[0]))
+    assert len(production_log.queries) == 3
+    run(database.get_production_data('U1', *windows[1]))
+    assert len(production_log.queries) == 4
+
+
+# ---------------------------------------------------------------------------
+# Live tail: delta merge and rebase
+# ---------------------------------------------------------------------------
+
+def _live_model_counts(unit_name, start, end):
+    return run(database._fetch_live_counts(
+        database._MODEL_QUERY, database._MODEL_DELTA_QUERY, database._split_model_rows, unit_name, start, end,
+    ))
+
+
+def _full_model_counts(log, unit_name, start, end):
+    return database._split_model_rows(log.answer(database._MODEL_QUERY, (unit_name, start, end)))
+
+
+def test_live_deltas_add_up_to_a_full_read(production_log):
+    start = datetime(2026, 1, 5, 8, tzinfo=TIMEZONE)
+    ends = [start + timedelta(seconds=s) for s in (300, 312, 324, 336, 600)]
+    previous_end = start
+    for i, end in enumerate(ends):
+        # Rows inside the step, one exactly on each tick end, another unit,
+        # and a second model/target appearing only part-way through
+        production_log.add('U1', previous_end + (end - previous_end) / 2, passed=i % 2 == 0)
+        production_log.add('U1', end)
+        production_log.add('U2', end)
+        if i >= 2:
+            production_log.add('U1', end - timedelta(seconds=1), model='M2', target=None)
+
+        assert _live_model_counts('U1', start, end) == _full_model_counts(production_log, 'U1', start, end)
+        previous_end = end
+
+    assert production_log.queries == [database._MODEL_QUERY] + [database._MODEL_DELTA_QUERY] * (len(ends) - 1)
+
+
+def test_empty_delta_keeps_counts(production_log):
+    start = datetime(2026, 1, 5, 8, tzinfo=TIMEZONE)
+    production_log.add('U1', start + timedelta(minutes=1))
+
+    first = _live_model_counts('U1', start, start + timedelta(minutes=5))
+    second = _live_model_counts('U1', start, start + timedelta(minutes=5, seconds=12))
+
+    assert first == second == ({('M1', 60): (1, 0)}, (1, 0))
+
+
+def test_live_tail_rebases_and_picks_up_late_commits(production_log, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(database, 'monotonic', lambda: clock[0])
+    start = datetime(2026, 1, 5, 8, tzinfo=TIMEZONE)
+    end = start + timedelta(minutes=5)
+
+    _live_model_counts('U1', start, end)
+    # Stamped before the previous end but only committed after that read:
+    # no delta can see it, the periodic full re-read must
+    production_log.add('U1', end - timedelta(seconds=1))
+    step = database.LIVE_TAIL_MAX_AGE / 2
+    while clock[0] + step - 1000.0 < database.LIVE_TAIL_REBASE:
+        clock[0] += step
+        end += timedelta(seconds=step)
+        _, totals = _live_model_counts('U1', start, end)
+    assert totals == (0, 0)
+    assert database._MODEL_QUERY not in production_log.queries[1:]
+
+    clock[0] += step
+    end += timedelta(seconds=step)
+    assert _live_model_counts('U1', start, end) == _full_model_counts(production_log, 'U1', start, end)
+    assert production_log.queries[-1] is database._MODEL_QUERY
+
+
+@pytest.mark.parametrize("change", ["idle", "end moved back"])
+def test_live_tail_rereads_when_entry_cannot_be_advanced(production_log, monkeypatch, change):
+    clock = [1000.0]
+    monkeypatch.setattr(database, 'monotonic', lambda: clock[0])
+    start = datetime(2026, 1, 5, 8, tzinfo=TIMEZONE)
+    end = start + timedelta(minutes=5)
+    production_log.add('U1', start + timedelta(minutes=1))
+    _live_model_counts('U1', start, end)
+
+    if change == "idle":
+        clock[0] += database.LIVE_TAIL_MAX_AGE
+        end += timedelta(minutes=1)
+    else:
+        end -= timedelta(minutes=1)
+    assert _live_model_counts('U1', start, end) == _full_model_counts(production_log, 'U1', start, end)
+    assert production_log.queries == [database._MODEL_QUERY] * 2
+
+
+# ---------------------------------------------------------------------------
+# Live hourly buckets
+# ---------------------------------------------------------------------------
+
+def _bucket_counts(buckets):
+    return {
+        (hour_start, m['model'], m['target']): (m['success_qty'], m['fail_qty'])
+        for hour_start, models in buckets.items()
+        for m in models
+    }
+
+
+def test_live_hourly_matches_full_read_across_hour_boundary(production_log):
+    start = datetime(2026, 1, 5, 8, tzinfo=TIMEZONE)
+    boundary = start + timedelta(hours=1)
+    production_log.add('U1', start + timedelta(minutes=30))
+    production_log.add('U1', boundary - timedelta(microseconds=1))
+    production_log.add('U1', boundary, passed=False)  # belongs to the 09:00 bucket only
+
+    for seconds in range(-36, 60, 12):
+        end = boundary + timedelta(seconds=seconds)
+        production_log.add('U1', end - timedelta(seconds=5))
+        live = run(database.get_production_data_hourly('U1', start, end, is_live=True))
+        # Live reads stop 2 seconds short of end
+        full = run(database.get_production_data_hourly('U1', start, end - timedelta(seconds=2)))
+        assert _bucket_counts(live) == _bucket_counts(full), end
+
+    counts = _bucket_counts(live)
+    assert sum(s + f for s, f in counts.values()) == len(production_log.records)
+    assert counts[(start, 'M1', 60)] == (len([r for r in production_log.records if r[3] < boundary]), 0)
+
+
+def test_live_hourly_counts_rows_inside_the_buffer_once(production_log):
+    start = datetime(2026, 1, 5, 8, tzinfo=TIMEZONE)
+    end = start + timedelta(minutes=10)
+    production_log.add('U1', end - timedelta(seconds=1))
+
+    first = run(database.get_production_data_hourly('U1', start, end, is_live=True))
+    second = run(database.get_production_data_hourly('U1', start, end + timedelta(seconds=12), is_live=True))
+    third = run(database.get_production_data_hourly('U1', start, end + timedelta(seconds=24), is_live=True))
+
+    assert first == {}
+    assert _bucket_counts(second) == _bucket_counts(third) == {(start, 'M1', 60): (1, 0)}
+    assert production_log.queries == [database._HOURLY_QUERY] + [database._HOURLY_DELTA_QUERY] * 2
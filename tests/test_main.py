@@ -0,0 +1,134 @@
+"""
+main.py helpers that need no running server: conditional GETs for settled
+windows and the hourly refresher's handling of settled hours.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aioodbc")
+pytest.importorskip("pyodbc")
+pytest.importorskip("dotenv")
+pytest.importorskip("fastapi")
+
+from fastapi import Request, Response
+
+import main
+from database import TIMEZONE
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# ---------------------------------------------------------------------------
+# ETag / If-None-Match
+# ---------------------------------------------------------------------------
+
+SETTLED_START = datetime(2025, 3, 3, 8, tzinfo=TIMEZONE)
+SETTLED_END = SETTLED_START + timedelta(hours=8)
+
+
+def _request(if_none_match=None):
+    headers = [(b'if-none-match', if_none_match.encode())] if if_none_match is not None else []
+    return Request({
+        'type': 'http', 'method': 'GET', 'path': '/api/historical-data', 'query_string': b'', 'headers': headers,
+    })
+
+
+def _settled_etag(request, response, end=SETTLED_END):
+    return main._settled_etag(request, response, 'U1', SETTLED_START, end, 'mode1')
+
+
+@pytest.fixture
+def etag():
+    response = Response()
+    assert _settled_etag(_request(), response) is None
+    assert response.headers['cache-control'] == 'public, max-age=86400'
+    return response.headers['etag']
+
+
+@pytest.mark.parametrize("header", [
+    "{etag}",
+    "W/{etag}",
+    "*",
+    '"other", {etag}',
+    '"other",W/{etag}',
+])
+def test_matching_if_none_match_returns_304(etag, header):
+    not_modified = _settled_etag(_request(header.format(etag=etag)), Response())
+
+    assert not_modified is not None
+    assert not_modified.status_code == 304
+    assert not_modified.headers['etag'] == etag
+
+
+@pytest.mark.parametrize("header", ['"other"', 'W/"other"', ''])
+def test_other_if_none_match_gets_a_normal_reply(etag, header):
+    response = Response()
+
+    assert _settled_etag(_request(header), response) is None
+    assert response.headers['etag'] == etag
+
+
+def test_etag_depends_on_window(etag):
+    response = Response()
+    _settled_etag(_request(), response, end=SETTLED_END + timedelta(hours=1))
+
+    assert response.headers['etag'] != etag
+
+
+def test_live_window_gets_no_caching_headers():
+    response = Response()
+
+    assert _settled_etag(_request('*'), response, end=datetime.now(TIMEZONE)) is None
+    assert 'etag' not in response.headers
+
+
+# ---------------------------------------------------------------------------
+# Hourly refresher: settled hours
+# ---------------------------------------------------------------------------
+
+def test_hours_close_from_full_reads_only(production_log):
+    import database
+
+    start = datetime(2026, 1, 5, 10, tzinfo=TIMEZONE)
+    end = start + timedelta(hours=1, minutes=2)
+    hour = start
+    refresher = main.HourlyRefresher(('HOURLY', 'U1', start, end, 'mode1'), 'U1', start, end, 'mode1')
+
+    def hour_entry(payload):
+        return next(h for h in payload['hourly_data'] if h['hour_start'] == hour.isoformat())
+
+    current_time = end - timedelta(minutes=5)
+    stamp = start
+    live_counts = []
+    closed_ticks = 0
+    while current_time <= end + timedelta(minutes=5):
+        production_log.now = current_time
+        while stamp < current_time:
+            production_log.add('U1', stamp)
+            stamp += timedelta(seconds=4)
+        # Stamped before the previous tick's read but committed after it:
+        # the live deltas never see this row
+        production_log.add('U1', current_time - timedelta(seconds=17), committed_at=current_time)
+
+        closed_before = hour in refresher.closed_hours
+        queries_before = len(production_log.queries)
+        extra = run(refresher.fetch_extra(current_time))
+        payload = refresher.build_payload([], extra, current_time)
+        if not closed_before:
+            live_counts.append(hour_entry(payload)['success_qty'])
+        else:
+            # A closed hour is reused as-is, not queried again
+            assert production_log.queries[queries_before:] == [database._HOURLY_DELTA_QUERY]
+            closed_ticks += 1
+        current_time += timedelta(seconds=12)
+
+    expected = sum(1 for record in production_log.records if start <= record[3] < start + timedelta(hours=1))
+    assert hour in refresher.closed_hours and closed_ticks > 0
+    assert refresher.closed_hours[hour]['success_qty'] == expected
+    assert hour_entry(payload)['success_qty'] == expected
+    # The stragglers were missing from the live reads until the hour closed
+    assert live_counts[-2] < expected == live_counts[-1]
@@ -0,0 +1,117 @@
+"""
+Closed-form break time and integer-range hourly slices, checked against the
+straightforward day-by-day / hour-by-hour versions they replaced.
+"""
+import random
+from datetime import datetime, time, timedelta
+
+import pytest
+
+pytest.importorskip("aioodbc")
+pytest.importorskip("pyodbc")
+pytest.importorskip("dotenv")
+
+import database
+from database import TIMEZONE, SECONDS_PER_DAY
+
+CASES = 5000
+
+
+def _random_windows(seed):
+    rng = random.Random(seed)
+    origin = datetime(2026, 1, 1, tzinfo=TIMEZONE)
+    for _ in range(CASES):
+        start = origin + timedelta(seconds=rng.randint(0, 60 * SECONDS_PER_DAY))
+        if rng.random() < 0.3:
+            start = start.replace(minute=0, second=0)
+            end = start + timedelta(hours=rng.randint(1, 30))
+        else:
+            end = start + timedelta(seconds=rng.choice([
+                rng.randint(0, 3600), rng.randint(0, 9 * SECONDS_PER_DAY), 0, -100,
+            ]))
+        yield start, end
+
+
+def _reference_break_seconds(start_time, end_time, breaks):
+    """Per day from start_time's date to end_time's date, add each break's overlap."""
+    total = 0
+    day = start_time.date()
+    while day <= end_time.date():
+        midnight = datetime.combine(day, time(), TIMEZONE)
+        for break_start, break_end in breaks:
+            overlap = (
+                min(end_time, midnight + timedelta(seconds=break_end))
+                - max(start_time, midnight + timedelta(seconds=break_start))
+            )
+            if overlap > timedelta(0):
+                total += overlap.total_seconds()
+        day += timedelta(days=1)
+    return total
+
+
+@pytest.mark.parametrize("working_mode", ["mode1", "mode2", "mode3", "unknown"])
+def test_break_time_matches_day_by_day(working_mode):
+    breaks = database._BREAKS_BY_MODE.get(working_mode, database._BREAKS_BY_MODE['mode1'])
+    for start, end in _random_windows(working_mode):
+        expected = _reference_break_seconds(start, end, breaks)
+        assert database.calculate_break_time(start, end, working_mode) == pytest.approx(expected), (start, end)
+
+
+def test_break_crossing_midnight(monkeypatch):
+    # 23:30-00:30 runs into the next day; the interior-day shortcut must still count it once per day
+    monkeypatch.setitem(database.SHIFT_BREAKS, 'late', {'start': '23:30', 'end': '00:30'})
+    breaks = (database._break_window('late'), database._break_window('a'))
+    assert breaks[0] == (23 * 3600 + 1800, SECONDS_PER_DAY + 1800)
+    for start, end in _random_windows("midnight"):
+        expected = _reference_break_seconds(start, end, breaks)
+        assert database._break_seconds(start.timestamp(), end.timestamp(), breaks) == pytest.approx(expected), (start, end)
+
+
+def test_break_times_matches_single_calls():
+    windows = list(_random_windows("batch"))[:500]
+    assert database.calculate_break_times(windows, 'mode3') == [
+        database.calculate_break_time(start, end, 'mode3') for start, end in windows
+    ]
+
+
+def _reference_hourly_slices(start_time, end_time, current_time, live_window):
+    """Walk clock hours one timedelta at a time, clamping the open hour to now."""
+    slices = []
+    current_hour = start_time.replace(minute=0, second=0, microsecond=0)
+
+    is_live_data = False
+    actual_end_for_hourly = end_time
+    if current_time:
+        is_live_data = abs(current_time - end_time) <= live_window
+        if is_live_data:
+            actual_end_for_hourly = current_time
+
+    while current_hour < actual_end_for_hourly:
+        hour_end = current_hour + timedelta(hours=1)
+        if is_live_data and current_hour < current_time < hour_end:
+            hour_end = current_time
+        else:
+            hour_end = min(hour_end, actual_end_for_hourly)
+        slices.append((current_hour, hour_end))
+        if is_live_data and hour_end == current_time:
+            current_hour = current_hour + timedelta(hours=1)
+        else:
+            current_hour = hour_end
+    return slices
+
+
+def test_hourly_slices_match_hour_by_hour():
+    pytest.importorskip("fastapi")
+    import main
+
+    rng = random.Random("slices")
+    for start, end in _random_windows("slices"):
+        if end < start:
+            continue
+        start += timedelta(microseconds=rng.randint(0, 999999))
+        # live (now near the end), historical, and sub-hour windows
+        current_time = end + timedelta(seconds=rng.choice([
+            rng.randint(-300, 300), rng.randint(301, SECONDS_PER_DAY), rng.randint(0, 59),
+        ]), microseconds=rng.randint(0, 999999))
+        expected = _reference_hourly_slices(start, end, current_time, main.LIVE_WINDOW)
+        assert main._hourly_slices(start, end, current_time) == expected, (start, end, current_time)